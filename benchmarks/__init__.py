@@ -0,0 +1,7 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Benchmarks of GoGuru's own overhead, run without Sublime Text on stand-in
+'sublime'/'sublime_plugin' modules and a fake guru, see run.py.
+"""
@@ -0,0 +1,105 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Checks the gopls backend (core.lsp) against the stub server fakegopls.py.
+
+    python -m benchmarks.check_lsp
+
+Exits with status 1, after listing them, when some checks fail.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from . import harness
+
+
+A = '''package fake
+
+// Foo does nothing, «ünï»
+func Foo() int {
+\treturn 1
+}
+
+func bar() int {
+\treturn Foo() + Foo()
+}
+'''
+
+B = '''package fake
+
+func baz() int {
+\treturn Foo()
+}
+'''
+
+
+def main():
+    sys.path.insert(0, harness.ROOT)
+    from core import lsp
+
+    tmp = tempfile.mkdtemp(prefix='goguru-lsp-')
+    failures = []
+
+    def check(name, got, expected):
+        if got != expected:
+            failures.append('%s: got %r, expected %r' % (name, got, expected))
+        print('%-24s %s' % (name, 'ok' if got == expected else 'FAILED'))
+
+    a, b = os.path.join(tmp, 'a.go'), os.path.join(tmp, 'b.go')
+    with open(os.path.join(tmp, 'go.mod'), 'w') as f:
+        f.write('module fake\n')
+    for path, text in ((a, A), (b, B)):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    server = os.path.join(harness.ROOT, 'benchmarks', 'fakegopls.py')
+    client = lsp.LspClient([sys.executable, server], tmp, timeout=10)
+    try:
+        client.start()
+        check('incremental sync', client.incremental, True)
+
+        # 'Foo()' in bar, 0-based line 8
+        line, character = 8, A.split('\n')[8].index('Foo') + 1
+        client.sync(a, A, 1)
+        check('definition', client.query('definition', a, line, character), '%s:4:6: defined here\n' % a)
+        check('hover', client.query('describe', a, line, character), '%s:%d:%d: func Foo() int\n' % (a, line + 1, character + 1))
+        # the doc comment counts too, the stub matches names
+        check('references', client.query('referrers', a, line, character).count(': reference'), 5)
+
+        # unsaved buffers are what the server sees
+        edited = A.replace('func bar', '// «ë» edited\nfunc bar')
+        client.sync(a, edited, 2)
+        check('incremental change', client.request('$/goguru/text', {'uri': lsp.path_to_uri(a)}), edited)
+        check('definition after edit', client.query('definition', a, line + 1, character), '%s:4:6: defined here\n' % a)
+        client.sync(b, B + 'var _ = Foo\n', 1)
+        check('unsaved references', client.query('referrers', a, line + 1, character).count(': reference'), 6)
+
+        client.close_document(b)
+        check('closed document', client.request('$/goguru/text', {'uri': lsp.path_to_uri(b)}), None)
+    except lsp.LspError as e:
+        failures.append(str(e))
+        print(e)
+    finally:
+        client.shutdown()
+
+    # a server failing the handshake doesn't outlive it
+    client = lsp.LspClient([sys.executable, server], tmp, env=dict(os.environ, FAKEGOPLS_FAIL='1'), timeout=10)
+    try:
+        client.start()
+    except lsp.LspError:
+        pass
+    check('failed start killed', client.alive(), False)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    if failures:
+        print('%d check(s) failed:\n%s' % (len(failures), '\n'.join(failures)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Stub language server: speaks enough LSP over stdio to stand in for gopls.
+
+Identifiers are matched by name over the open documents (with their
+incremental changes applied) and the .go files of the root directory:
+the definition is the 'func|type|var|const NAME', the references are every
+occurrence and the hover is the definition line. '$/goguru/text' returns
+a document as the server sees it. With FAKEGOPLS_FAIL set initialize fails.
+"""
+
+import json
+import os
+import re
+import sys
+from urllib.parse import quote, unquote, urlparse
+
+
+DECLARATION = r'\b(?:func|type|var|const)\s+(?:\([^)]*\)\s*)?%s\b'
+
+
+def uri_path(uri):
+    return unquote(urlparse(uri).path)
+
+
+def path_uri(path):
+    return 'file://' + quote(path)
+
+
+def offset(text, position):
+    """ Character offset of an LSP (line, utf-16 character) position.
+    """
+    start = 0
+    for _ in range(position['line']):
+        start = text.index('\n', start) + 1
+    units = position['character']
+    i = start
+    while units > 0 and i < len(text):
+        units -= len(text[i].encode('utf-16-le')) // 2
+        i += 1
+    return i
+
+
+def position(text, index):
+    line = text.count('\n', 0, index)
+    start = text.rfind('\n', 0, index) + 1
+    return {'line': line, 'character': len(text[start:index].encode('utf-16-le')) // 2}
+
+
+class Server(object):
+
+    def __init__(self):
+        self.root = None
+        self.documents = {}  # uri -> text
+
+    def sources(self):
+        sources = dict(self.documents)
+        if self.root is not None:
+            for name in sorted(os.listdir(self.root)):
+                uri = path_uri(os.path.join(self.root, name))
+                if name.endswith('.go') and uri not in sources:
+                    with open(os.path.join(self.root, name), encoding='utf-8') as f:
+                        sources[uri] = f.read()
+        return sources
+
+    def word(self, params):
+        uri = params['textDocument']['uri']
+        text = self.sources().get(uri, '')
+        index = offset(text, params['position'])
+        for match in re.finditer(r'\w+', text):
+            if match.start() <= index <= match.end():
+                return match.group()
+        return None
+
+    def location(self, uri, text, start, end):
+        return {'uri': uri, 'range': {'start': position(text, start), 'end': position(text, end)}}
+
+    def definition(self, word):
+        for uri, text in sorted(self.sources().items()):
+            match = re.search(DECLARATION % re.escape(word), text)
+            if match:
+                return uri, text, match
+        return None
+
+    def handle(self, method, params):
+        if method == 'initialize':
+            if os.environ.get('FAKEGOPLS_FAIL'):
+                raise ValueError('initialize failed')
+            self.root = uri_path(params['rootUri'])
+            return {'capabilities': {'textDocumentSync': {'openClose': True, 'change': 2},
+                                     'definitionProvider': True, 'hoverProvider': True, 'referencesProvider': True}}
+        if method == 'shutdown':
+            return None
+        if method == '$/goguru/text':
+            return self.documents.get(params['uri'])
+        word = self.word(params)
+        if word is None:
+            return None
+        if method == 'textDocument/definition':
+            found = self.definition(word)
+            if found is None:
+                return []
+            uri, text, match = found
+            start = match.end() - len(word)
+            return [self.location(uri, text, start, match.end())]
+        if method == 'textDocument/hover':
+            found = self.definition(word)
+            if found is None:
+                return None
+            _, text, match = found
+            line = text[text.rfind('\n', 0, match.start()) + 1:text.find('\n', match.start())]
+            return {'contents': {'kind': 'plaintext', 'value': line.rstrip(' {')}}
+        if method == 'textDocument/references':
+            refs = []
+            for uri, text in sorted(self.sources().items()):
+                for match in re.finditer(r'\b%s\b' % re.escape(word), text):
+                    refs.append(self.location(uri, text, match.start(), match.end()))
+            return refs
+        raise ValueError('method not found: %s' % method)
+
+    def notified(self, method, params):
+        if method == 'textDocument/didOpen':
+            self.documents[params['textDocument']['uri']] = params['textDocument']['text']
+        elif method == 'textDocument/didChange':
+            uri = params['textDocument']['uri']
+            for change in params['contentChanges']:
+                if 'range' not in change:
+                    self.documents[uri] = change['text']
+                    continue
+                text = self.documents[uri]
+                start = offset(text, change['range']['start'])
+                end = offset(text, change['range']['end'])
+                self.documents[uri] = text[:start] + change['text'] + text[end:]
+        elif method == 'textDocument/didClose':
+            self.documents.pop(params['textDocument']['uri'], None)
+
+
+def read_message(stream):
+    length = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.partition(b':')
+        if name.lower() == b'content-length':
+            length = int(value)
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_message(stream, message):
+    body = json.dumps(message).encode('utf-8')
+    stream.write(('Content-Length: %d\r\n\r\n' % len(body)).encode('ascii'))
+    stream.write(body)
+    stream.flush()
+
+
+def main():
+    server = Server()
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        message = read_message(stdin)
+        if message is None or message.get('method') == 'exit':
+            return
+        if 'id' not in message:
+            server.notified(message['method'], message.get('params'))
+            continue
+        try:
+            answer = {'result': server.handle(message['method'], message.get('params'))}
+        except Exception as e:
+            answer = {'error': {'code': -32601, 'message': str(e)}}
+        answer.update({'jsonrpc': '2.0', 'id': message['id']})
+        write_message(stdout, answer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Fake guru: reads the -modified archive like guru does, waits
+FAKEGURU_LATENCY ms and prints FAKEGURU_LINES results (plain or -json).
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def read_archive(stream):
+    while True:
+        name = stream.readline()
+        if not name:
+            return
+        size = int(stream.readline())
+        stream.read(size)
+
+
+def main(argv):
+    if '-modified' in argv:
+        read_archive(sys.stdin.buffer)
+    time.sleep(int(os.environ.get('FAKEGURU_LATENCY', '0')) / 1000.0)
+    lines = int(os.environ.get('FAKEGURU_LINES', '10'))
+    target = os.environ.get('FAKEGURU_FILE', '/tmp/fake/main.go')
+    out = sys.stdout
+    if '-json' in argv:
+        out.write(json.dumps({'objpos': '%s:1:6' % target, 'desc': 'func Fake()'}) + '\n')
+        refs = [{'pos': '%s:%d:%d' % (target, i + 1, i % 80 + 1), 'text': 'Fake() // call %d' % i} for i in range(lines)]
+        out.write(json.dumps({'package': 'fake', 'refs': refs}, indent='\t') + '\n')
+    else:
+        for i in range(lines):
+            out.write('%s:%d.%d-%d.%d: reference to func Fake() // call %d\n' % (target, i + 1, i % 80 + 1, i + 1, i % 80 + 5, i))
+    out.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,109 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Loads goGuru.py on top of the stubs and drives it like the editor would.
+"""
+
+import importlib
+import os
+import stat
+import sys
+import types
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, 'benchmarks', 'stubs')
+
+# what the output view ends with once a result has been written
+RESULT_END = '\n\n\n'
+
+
+class FakeShellenv(object):
+    """ The login shell environment is the current one.
+    """
+
+    def get_env(self, for_subprocess=False):
+        return '/bin/sh', dict(os.environ)
+
+
+def load_plugin():
+    """ Imports goGuru.py as the GoGuru package would be, returns it.
+    """
+    if STUBS not in sys.path:
+        sys.path.insert(0, STUBS)
+    if 'GoGuru' not in sys.modules:
+        package = types.ModuleType('GoGuru')
+        package.__path__ = [ROOT]
+        sys.modules['GoGuru'] = package
+    plugin = importlib.import_module('GoGuru.goGuru')
+    plugin.shellenv = FakeShellenv()
+    return plugin
+
+
+def install_fake_guru(directory):
+    """ Writes the fake guru as 'guru' in 'directory', run by this interpreter.
+    """
+    with open(os.path.join(ROOT, 'benchmarks', 'fakeguru.py')) as f:
+        source = f.read().split('\n', 1)[1]
+    path = os.path.join(directory, 'guru')
+    with open(path, 'w') as f:
+        f.write('#!%s\n' % sys.executable)
+        f.write(source)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def configure(plugin, **settings):
+    """ Sets user settings (goguru_ prefixed, None erases them) and drops the
+    settings snapshots.
+    """
+    import sublime
+    user = sublime.load_settings('GoGuru.sublime-settings')
+    for key, value in settings.items():
+        if value is None:
+            user.erase('goguru_' + key)
+        else:
+            user.set('goguru_' + key, value)
+    plugin.invalidate_settings()
+
+
+def go_source(size):
+    """ Returns about 'size' characters of Go code, with some non ASCII text.
+    """
+    block = ('// Fake does nothing, «ünïcödé» comment\n'
+             'func Fake%d(a int, b string) (int, error) {\n'
+             '\tx := a + len(b) // ∑\n'
+             '\treturn x, nil\n'
+             '}\n\n')
+    parts = ['package fake\n\n']
+    total = len(parts[0])
+    i = 0
+    while total < size:
+        part = block % i
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return ''.join(parts)
+
+
+def open_go_view(window, path, text):
+    """ Returns a saved view of 'path' holding 'text' (also written to disk).
+    """
+    import sublime
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    view = window.add_view(sublime.View(window, text, file_name=path))
+    point = text.find('Fake0') + 2
+    view.sel().clear()
+    view.sel().add(sublime.Region(point))
+    return view
+
+
+def wait_result(view, previous_size, timeout=120):
+    """ Runs the main thread until a new result got written to 'view'.
+    """
+    import sublime
+    done = sublime.pump(lambda: view.size() > previous_size and view.text().endswith(RESULT_END), timeout)
+    if not done:
+        raise RuntimeError('timed out waiting for the result')
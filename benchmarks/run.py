@@ -0,0 +1,248 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Runs the benchmarks and compares them with the stored baselines.
+
+    python -m benchmarks [--quick] [-k PATTERN] [--update] [--threshold 0.25]
+
+Every case is timed 'repeat' times and the best run is kept. A case
+regresses when it is slower than its baseline by more than the threshold
+(and by more than --min-ms, so tiny cases don't fail on noise); the exit
+status is then 1. --update stores the current timings as the baselines.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import harness
+
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+SIZES = [('1KB', 1024), ('100KB', 100 * 1024), ('1MB', 1024 * 1024), ('10MB', 10 * 1024 * 1024)]
+LINES = [('10', 10), ('1k', 1000), ('10k', 10000), ('100k', 100000)]
+
+
+class Bench(object):
+    """ Shared state of the cases: the plugin, a window and the fake guru.
+    """
+
+    def __init__(self, quick=False):
+        self.plugin = harness.load_plugin()
+        import sublime
+        self.sublime = sublime
+        self.window = sublime.active_window()
+        self.tmp = tempfile.mkdtemp(prefix='goguru-bench-')
+        self.guru = harness.install_fake_guru(self.tmp)
+        self.sizes = SIZES[:2] if quick else SIZES
+        self.lines = LINES[:2] if quick else LINES
+        self.source = os.path.join(self.tmp, 'main.go')
+        harness.configure(self.plugin, output='output_panel', cache=False, use_current_package=False,
+                          stream_output=True, stream_interval=0, json=False,
+                          env={'PATH': self.tmp + os.pathsep + os.environ.get('PATH', '')})
+
+    def close(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def view(self, size):
+        self.window._views = []
+        return harness.open_go_view(self.window, self.source, harness.go_source(size))
+
+    def reset_output(self):
+        self.window._panels.clear()
+        self.plugin.location_tables.clear()
+        self.plugin.output_pagers.clear()
+
+    def guru_env(self, lines, json_output=False):
+        harness.configure(self.plugin, json=json_output, env={
+            'PATH': self.tmp + os.pathsep + os.environ.get('PATH', ''),
+            'FAKEGURU_LINES': str(lines),
+            'FAKEGURU_FILE': self.source})
+
+
+def cases(bench):
+    """ Yields (name, repeat, setup, run) for every case, 'run(state)' being
+    timed with the value 'setup()' returned.
+    """
+    plugin = bench.plugin
+    sublime = bench.sublime
+
+    # offsets
+    for label, size in bench.sizes:
+        def index_setup(size=size):
+            view = bench.view(size)
+            plugin.line_indexes.clear()
+            return view
+
+        def index_build(view):
+            plugin.byte_offset(view, view.size() // 2)
+        yield 'line_index_build[%s]' % label, 5, index_setup, index_build
+
+        def offsets_setup(size=size):
+            view = index_setup(size)
+            plugin.byte_offset(view, 0)
+            rand = random.Random(size)
+            return view, [rand.randrange(view.size()) for _ in range(1000)]
+
+        def offsets(state):
+            view, points = state
+            for point in points:
+                plugin.byte_offset(view, point)
+        yield 'byte_offset_x1000[%s]' % label, 5, offsets_setup, offsets
+
+    # settings
+    def settings(_):
+        for _ in range(10000):
+            plugin.get_setting('goguru_scope')
+    yield 'get_setting_x10k', 5, lambda: None, settings
+
+    def settings_rebuild(_):
+        for _ in range(100):
+            plugin.invalidate_settings()
+            plugin.get_settings(bench.window)
+    yield 'settings_snapshot_x100', 5, lambda: None, settings_rebuild
+
+    # queries, guru alone and through the whole plugin
+    for label, lines in bench.lines:
+        for json_output in (False, True):
+            suffix = '%s%s' % (label, ',json' if json_output else '')
+
+            def direct_setup(lines=lines, json_output=json_output):
+                bench.guru_env(lines, json_output)
+                env = dict(os.environ, FAKEGURU_LINES=str(lines), FAKEGURU_FILE=bench.source)
+                cmd = [bench.guru, '-json', 'referrers', bench.source + ':#10'] if json_output else \
+                      [bench.guru, 'referrers', bench.source + ':#10']
+                return cmd, env
+
+            def direct(state):
+                cmd, env = state
+                subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL, check=True)
+            yield 'guru_direct[%s]' % suffix, 3, direct_setup, direct
+
+            def query_setup(lines=lines, json_output=json_output):
+                bench.guru_env(lines, json_output)
+                bench.reset_output()
+                return bench.view(1024)
+
+            def query(view):
+                panel = bench.window.create_output_panel('GoGuru Output')
+                size = panel.size()
+                plugin.GoGuruCommand(view).run(object(), mode='referrers')
+                harness.wait_result(panel, size)
+            yield 'query[%s]' % suffix, 3, query_setup, query
+
+    # unsaved buffers are sent to guru as the -modified archive
+    for label, size in bench.sizes[-2:]:
+        def modified_setup(size=size):
+            bench.guru_env(10)
+            bench.reset_output()
+            view = bench.view(size)
+            view.replace_all(view.text())
+            return view
+        yield 'query_modified[%s]' % label, 3, modified_setup, query
+
+    # rendering
+    for label, lines in bench.lines:
+        def write_setup(lines=lines):
+            bench.reset_output()
+            view = bench.view(1024)
+            command = plugin.GoGuruCommand(view)
+            command.output = True
+            command.settings = plugin.get_settings(bench.window)
+            command.write_running('referrers')
+            result = ''.join('%s:%d.%d-%d.%d: reference to func Fake() // call %d\n' % (
+                bench.source, i + 1, i % 80 + 1, i + 1, i % 80 + 5, i) for i in range(lines))
+            return command, result
+
+        def write(state):
+            command, result = state
+            command.write_out(result, '')
+            sublime.pump()
+        yield 'write_out[%s]' % label, 3, write_setup, write
+
+        def open_setup(lines=lines):
+            # every line rendered (and clickable)
+            harness.configure(plugin, max_lines={'*': 0})
+            command, result = write_setup(lines)
+            command.write_out(result, '')
+            harness.configure(plugin, max_lines=None)
+            panel = bench.window.create_output_panel('GoGuru Output')
+            rows = [panel.text_point(row, 0) for row in range(1, min(lines, 1000))]
+            return panel, rows
+
+        def open_result(state):
+            panel, rows = state
+            listener = plugin.GoGuruOpenResultCommand()
+            for point in rows:
+                panel.sel().clear()
+                panel.sel().add(sublime.Region(point, point + 5))
+                listener.on_selection_modified(panel)
+        yield 'open_result_x1000[%s]' % label, 3, open_setup, open_result
+
+
+def measure(repeat, setup, run):
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='GoGuru benchmarks.')
+    parser.add_argument('-k', '--keyword', default='', help='only run the cases whose name contains it')
+    parser.add_argument('--quick', action='store_true', help='only the small inputs')
+    parser.add_argument('--update', action='store_true', help='store the timings as the new baselines')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (0.25 is 25%%)')
+    parser.add_argument('--min-ms', type=float, default=0.5, help='slowdowns below it are ignored')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    except (OSError, IOError, ValueError):
+        baselines = {}
+
+    bench = Bench(quick=args.quick)
+    timings = {}
+    regressions = []
+    try:
+        for name, repeat, setup, run in cases(bench):
+            if args.keyword not in name:
+                continue
+            ms = measure(repeat, setup, run)
+            timings[name] = round(ms, 3)
+            baseline = baselines.get(name)
+            note = ''
+            if baseline is not None:
+                change = (ms - baseline) / baseline if baseline else 0
+                note = '%+6.1f%%' % (change * 100)
+                if change > args.threshold and ms - baseline > args.min_ms:
+                    note += '  REGRESSION'
+                    regressions.append(name)
+            print('%-34s %10.3f ms  %s' % (name, ms, note))
+            sys.stdout.flush()
+    finally:
+        bench.close()
+
+    if args.update:
+        baselines.update(timings)
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print('baselines updated')
+    if regressions:
+        print('%d regression(s): %s' % (len(regressions), ', '.join(regressions)))
+        return 1
+    return 0
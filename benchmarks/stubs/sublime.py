@@ -0,0 +1,446 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Stand-in for Sublime Text's 'sublime' module, just what GoGuru uses.
+
+Buffers are plain strings, callbacks given to set_timeout are queued and
+run by pump() (the benchmark's "main thread").
+"""
+
+import bisect
+import itertools
+import json
+import re
+import threading
+import time
+
+import sublime_plugin
+
+
+ENCODED_POSITION = 1
+MONOSPACE_FONT = 1
+
+_ids = itertools.count(1)
+
+
+class Region(object):
+
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def contains(self, point):
+        return self.begin() <= point <= self.end()
+
+    def __eq__(self, other):
+        return (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+
+class Selection(object):
+
+    def __init__(self):
+        self._regions = [Region(0)]
+
+    def __len__(self):
+        return len(self._regions)
+
+    def __getitem__(self, i):
+        return self._regions[i]
+
+    def __iter__(self):
+        return iter(list(self._regions))
+
+    def clear(self):
+        self._regions = []
+
+    def add(self, region):
+        self._regions.append(region)
+
+
+class Settings(object):
+
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+        self._listeners = {}
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def has(self, key):
+        return key in self._values
+
+    def set(self, key, value):
+        self._values[key] = value
+        for callback in list(self._listeners.values()):
+            callback()
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        self._listeners[tag] = callback
+
+    def clear_on_change(self, tag):
+        self._listeners.pop(tag, None)
+
+
+_WORD = re.compile(r'\w+')
+
+
+class View(object):
+    """ A buffer and its only view. Appending is cheap, the line starts are
+    rebuilt on demand after other edits.
+    """
+
+    def __init__(self, window=None, text='', file_name=None):
+        self._id = next(_ids)
+        self._buffer_id = next(_ids)
+        self._window = window
+        self._chunks = [text]
+        self._text = text
+        self._starts = None
+        self._name = ''
+        self._file_name = file_name
+        self._change_count = 0
+        self._dirty = False
+        self._settings = Settings()
+        self._sel = Selection()
+        self._status = {}
+        self.line_ending = 'Unix'
+
+    # identity
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._buffer_id
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_syntax_file(self, syntax):
+        pass
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def settings(self):
+        return self._settings
+
+    def is_dirty(self):
+        return self._dirty
+
+    def line_endings(self):
+        return self.line_ending
+
+    def change_count(self):
+        return self._change_count
+
+    def sel(self):
+        return self._sel
+
+    # contents
+
+    def text(self):
+        if len(self._chunks) > 1:
+            self._text = ''.join(self._chunks)
+            self._chunks = [self._text]
+        return self._text
+
+    def size(self):
+        return len(self.text())
+
+    def substr(self, region):
+        text = self.text()
+        if isinstance(region, int):
+            return text[region:region + 1]
+        return text[region.begin():region.end()]
+
+    def insert(self, edit, point, text):
+        if point == self.size():
+            self._chunks.append(text)
+            if self._starts is not None:
+                base = point
+                i = text.find('\n')
+                while i != -1:
+                    self._starts.append(base + i + 1)
+                    i = text.find('\n', i + 1)
+        else:
+            current = self.text()
+            self._chunks = [current[:point] + text + current[point:]]
+            self._starts = None
+        self._changed()
+        return len(text)
+
+    def replace_all(self, text):
+        """ Test helper: replaces the whole buffer, marking it dirty.
+        """
+        self._chunks = [text]
+        self._text = text
+        self._starts = None
+        self._changed()
+
+    def _changed(self):
+        self._change_count += 1
+        if self._file_name:
+            self._dirty = True
+
+    def _line_starts(self):
+        if self._starts is None:
+            text = self.text()
+            starts = [0]
+            i = text.find('\n')
+            while i != -1:
+                starts.append(i + 1)
+                i = text.find('\n', i + 1)
+            self._starts = starts
+        return self._starts
+
+    def rowcol(self, point):
+        starts = self._line_starts()
+        row = bisect.bisect_right(starts, point) - 1
+        return row, point - starts[row]
+
+    def text_point(self, row, col):
+        starts = self._line_starts()
+        row = min(row, len(starts) - 1)
+        return starts[row] + col
+
+    def line(self, point):
+        if isinstance(point, Region):
+            point = point.begin()
+        row, _ = self.rowcol(point)
+        starts = self._line_starts()
+        end = starts[row + 1] - 1 if row + 1 < len(starts) else self.size()
+        return Region(starts[row], end)
+
+    def word(self, point):
+        if isinstance(point, Region):
+            point = point.begin()
+        line = self.line(point)
+        text = self.substr(line)
+        for m in _WORD.finditer(text):
+            if line.a + m.start() <= point <= line.a + m.end():
+                return Region(line.a + m.start(), line.a + m.end())
+        return Region(point, point)
+
+    def match_selector(self, point, selector):
+        return 'source.go' in selector and bool(self._file_name)
+
+    # display
+
+    def show(self, point):
+        pass
+
+    def text_to_layout(self, point):
+        return (0, self.rowcol(max(point, 0))[0])
+
+    def set_viewport_position(self, position, animate=True):
+        pass
+
+    def run_command(self, name, args=None):
+        return sublime_plugin.run_text_command(self, name, args or {})
+
+
+class Window(object):
+
+    def __init__(self):
+        self._id = next(_ids)
+        self._views = []
+        self._panels = {}
+        self._active = None
+        self.project = None
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._active
+
+    def add_view(self, view):
+        """ Test helper: adds an existing view to the window.
+        """
+        view._window = self
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def new_file(self):
+        return self.add_view(View(self))
+
+    def open_file(self, name, flags=0):
+        path = name.rsplit(':', 2)[0] if flags & ENCODED_POSITION else name
+        for view in self._views:
+            if view.file_name() == path:
+                return view
+        return self.add_view(View(self, file_name=path))
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def create_output_panel(self, name):
+        view = self._panels.get(name)
+        if view is None:
+            view = self._panels[name] = View(self)
+        return view
+
+    def get_view_index(self, view):
+        if view in self._views:
+            return 0, self._views.index(view)
+        return -1, -1
+
+    def focus_view(self, view):
+        self._active = view
+
+    def focus_group(self, group):
+        pass
+
+    def project_data(self):
+        return self.project
+
+    def show_quick_panel(self, items, on_done, flags=0):
+        on_done(-1)
+
+    def show_input_panel(self, caption, initial, on_done, on_change, on_cancel):
+        return View(self)
+
+    def run_command(self, name, args=None):
+        return sublime_plugin.run_window_command(self, name, args or {})
+
+
+# main thread
+
+_queue = []
+_queue_lock = threading.Lock()
+
+
+def set_timeout(callback, delay=0):
+    with _queue_lock:
+        _queue.append((time.perf_counter() + delay / 1000.0, callback))
+
+
+set_timeout_async = set_timeout
+
+
+def pump(until=None, timeout=60):
+    """ Runs the queued callbacks as they come due, until 'until()' is true
+    (or the queue is empty when None).
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        if until is not None and until():
+            return True
+        now = time.perf_counter()
+        with _queue_lock:
+            due = [c for c in _queue if c[0] <= now]
+            for c in due:
+                _queue.remove(c)
+            empty = not _queue
+        for _, callback in due:
+            callback()
+        if until is None and empty and not due:
+            return True
+        if now > deadline:
+            return False
+        if not due:
+            time.sleep(0.0005)
+
+
+# application
+
+_windows = [Window()]
+_settings = {}
+
+
+def active_window():
+    return _windows[0]
+
+
+def windows():
+    return list(_windows)
+
+
+def load_settings(name):
+    settings = _settings.get(name)
+    if settings is None:
+        settings = _settings[name] = Settings()
+    return settings
+
+
+def save_settings(name):
+    pass
+
+
+def cache_path():
+    import tempfile
+    return tempfile.gettempdir()
+
+
+def platform():
+    import sys
+    return 'windows' if sys.platform == 'win32' else 'osx' if sys.platform == 'darwin' else 'linux'
+
+
+def version():
+    return '4000'
+
+
+def load_resource(name):
+    raise IOError('resource not found: ' + name)
+
+
+_COMMENTS = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.DOTALL)
+_TRAILING_COMMAS = re.compile(r',(\s*[}\]])')
+
+
+def decode_value(text):
+    text = _COMMENTS.sub(lambda m: m.group(1) or '', text)
+    return json.loads(_TRAILING_COMMAS.sub(r'\1', text))
+
+
+def error_message(message):
+    print('error_message:', message)
+
+
+def status_message(message):
+    pass
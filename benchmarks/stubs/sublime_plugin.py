@@ -0,0 +1,64 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Stand-in for Sublime Text's 'sublime_plugin' module: command classes are
+registered under their snake_case name so run_command finds them.
+"""
+
+import re
+
+
+_text_commands = {}
+_window_commands = {}
+_application_commands = {}
+
+
+def command_name(cls):
+    name = cls.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+
+class TextCommand(object):
+
+    def __init__(self, view):
+        self.view = view
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _text_commands[command_name(cls)] = cls
+
+
+class WindowCommand(object):
+
+    def __init__(self, window):
+        self.window = window
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _window_commands[command_name(cls)] = cls
+
+
+class ApplicationCommand(object):
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _application_commands[command_name(cls)] = cls
+
+
+class EventListener(object):
+    pass
+
+
+def run_text_command(view, name, args):
+    cls = _text_commands.get(name)
+    if cls is not None:
+        return cls(view).run(object(), **args)
+
+
+def run_window_command(window, name, args):
+    cls = _window_commands.get(name)
+    if cls is not None:
+        return cls(window).run(**args)
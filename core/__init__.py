@@ -0,0 +1,7 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Editor independent building blocks used by goGuru.py.
+Nothing in here imports sublime, so it can be reused outside the editor.
+"""
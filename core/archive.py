@@ -0,0 +1,97 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+guru -modified archive.
+
+The archive lists the files whose contents differ from what is on disk, each
+entry being the file name, a line with the contents size in bytes and the
+contents themselves. Files not in the archive are read from disk by guru.
+"""
+
+import hashlib
+import threading
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def encode(text, crlf=False):
+    """ Returns the bytes of a buffer 'text' as they would be saved.
+    """
+    if crlf:
+        text = text.replace('\n', '\r\n')
+    return text.encode('utf-8')
+
+
+class Snapshot(object):
+    """ The contents of a buffer taken once: its file name, text, line
+    endings and change count. 'data', the bytes as they would be saved, is
+    encoded once on first use and shared by everything the query derives
+    from the buffer (the line index, the archive and its digest).
+    """
+
+    def __init__(self, name, text, crlf=False, change_count=None):
+        self.name = name
+        self.text = text
+        self.crlf = crlf
+        self.change_count = change_count
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        with self._lock:
+            if self._data is None:
+                self._data = encode(self.text, self.crlf)
+            return self._data
+
+
+def digest(files):
+    """ Returns a hex digest of the archive entries, 'files' being a list of
+    (file name, contents bytes).
+    """
+    h = hashlib.sha1()
+    for name, data in files:
+        h.update(('%s\n%d\n' % (name, len(data))).encode('utf-8'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def write(stream, files, chunk_size=CHUNK_SIZE):
+    """ Streams the archive of 'files' (file name, contents bytes) to 'stream'
+    without building it in memory.
+    """
+    for name, data in files:
+        stream.write(('%s\n%d\n' % (name, len(data))).encode('utf-8'))
+        view = memoryview(data)
+        for i in range(0, len(data), chunk_size):
+            stream.write(view[i:i + chunk_size])
+
+
+class Bundle(object):
+    """ The archive of a set of unsaved buffers (Snapshot), hashed once
+    however many guru runs it is fed to.
+    """
+
+    def __init__(self, modified):
+        self.modified = modified
+        self._files = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def files(self):
+        with self._lock:
+            if self._files is None:
+                self._files = [(snapshot.name, snapshot.data) for snapshot in self.modified]
+            return self._files
+
+    def digest(self):
+        files = self.files()
+        with self._lock:
+            if self._digest is None:
+                self._digest = digest(files)
+            return self._digest
+
+    def __len__(self):
+        return len(self.modified)
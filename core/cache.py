@@ -0,0 +1,170 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Result cache for guru queries.
+
+Results are kept in memory (LRU, bounded by a byte budget) and optionally
+written to disk compressed, so results for saved files survive restarts.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from .results import Record
+
+
+# rough memory cost of a record (slots object, its strings and ints)
+RECORD_SIZE = 200
+
+
+def entry_size(entry):
+    out, err, records = entry
+    return len(out) + len(err) + (len(records) * RECORD_SIZE if records else 0)
+
+
+class LRUCache(object):
+    """ Thread-safe LRU cache holding at most 'max_entries' values.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_key(*parts):
+    """ Returns a hex digest identifying the given (json serializable) parts.
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """ Two tier (memory + disk) cache of (out, err, records) query results,
+    records being a list of results.Record or None.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None, disk_ttl=7 * 24 * 3600):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_ttl = disk_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.z')
+
+    def get(self, key):
+        """ Returns the cached (out, err, records) for 'key' or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, out, err, persist=False, records=None):
+        """ Stores a result, 'persist' also writes it to the disk tier.
+        """
+        self._remember(key, (out, err, records))
+        if persist and self.directory:
+            self._store(key, (out, err, records))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.z'):
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except OSError:
+                        pass
+
+    def _remember(self, key, entry):
+        cost = entry_size(entry)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(old)
+            self._entries[key] = entry
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.size -= entry_size(old)
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.disk_ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                out, err, records = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            if records is not None:
+                records = [Record.from_list(r) for r in records]
+            return out, err, records
+        except (OSError, IOError, ValueError, zlib.error):
+            return None
+
+    def _store(self, key, entry):
+        path = self._path(key)
+        tmp = path + '.tmp%d' % threading.get_ident()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                out, err, records = entry
+                if records is not None:
+                    records = [r.to_list() for r in records]
+                f.write(zlib.compress(json.dumps([out, err, records]).encode('utf-8'), 6))
+            os.replace(tmp, path)
+        except (OSError, IOError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,295 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Headless batch analysis, runs guru queries without Sublime Text.
+
+Run from the GoGuru package directory:
+
+    python -m core.cli [options] [TARGET ...]
+
+Targets are "file:#offset" (bytes), "file:offset" or "file:line:col", and
+--exported DIR adds every exported declaration of the Go files of DIR, e.g.
+to find API nobody uses:
+
+    python -m core.cli --mode referrers --exported ./pkg --unused --format csv
+
+The queries run on a pool of --jobs guru processes, progress goes to stderr
+and the JSON or CSV report to stdout (or --output).
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import packages, process, query
+from .results import JsonStreamDecoder
+
+
+# exported top level declarations, the name is the last group
+_FUNC = re.compile(br'^func[ \t]+(?:\([^)]*?(\w+)(?:\[[^\]]*\])?\)[ \t]*)?([A-Z]\w*)', re.MULTILINE)
+_SPEC = re.compile(br'^(?:type|var|const)[ \t]+([A-Z]\w*)', re.MULTILINE)
+_GROUP = re.compile(br'^(?:type|var|const)[ \t]*\((.*?)^\)', re.MULTILINE | re.DOTALL)
+_GROUP_SPEC = re.compile(br'^\t([A-Z]\w*)', re.MULTILINE)
+
+
+class Target(object):
+    """ A query position: file, byte offset and what is declared there.
+    """
+
+    __slots__ = ('file', 'offset', 'line', 'col', 'name')
+
+    def __init__(self, file, offset, line, col, name=''):
+        self.file = file
+        self.offset = offset
+        self.line = line
+        self.col = col
+        self.name = name
+
+    def location(self):
+        return '%s:%d:%d' % (self.file, self.line, self.col)
+
+
+def line_col(data, offset):
+    """ Returns the 1-based line and (byte) column of 'offset' in 'data'.
+    """
+    line_start = data.rfind(b'\n', 0, offset) + 1
+    return data.count(b'\n', 0, offset) + 1, offset - line_start + 1
+
+
+def declarations(path):
+    """ Returns a Target for every exported top level declaration of the Go
+    file 'path', methods being named "Type.Method".
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    found = []
+    for m in _FUNC.finditer(data):
+        name = m.group(2).decode('utf-8')
+        if m.group(1):
+            name = m.group(1).decode('utf-8') + '.' + name
+        found.append((m.start(2), name))
+    for m in _SPEC.finditer(data):
+        found.append((m.start(1), m.group(1).decode('utf-8')))
+    for group in _GROUP.finditer(data):
+        for m in _GROUP_SPEC.finditer(data, group.start(1), group.end(1)):
+            found.append((m.start(1), m.group(1).decode('utf-8')))
+    targets = []
+    for offset, name in sorted(found):
+        line, col = line_col(data, offset)
+        targets.append(Target(path, offset, line, col, name))
+    return targets
+
+
+def exported(directory):
+    """ Returns the exported declarations of the (non test) Go files of 'directory'.
+    """
+    targets = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.go') and not name.endswith('_test.go'):
+            targets.extend(declarations(os.path.join(directory, name)))
+    return targets
+
+
+def skip_query_object(out):
+    """ Drops the {"objpos", "desc"} object guru's referrers output starts
+    with, it describes the queried object and isn't a result.
+    """
+    text = out.lstrip()
+    if not text.startswith('{'):
+        return out
+    try:
+        value, end = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        return out
+    if isinstance(value, dict) and 'objpos' in value and set(value) <= {'objpos', 'desc'}:
+        return text[end:]
+    return out
+
+
+def parse_target(text):
+    """ Returns the Target of "file:#offset", "file:offset" or "file:line:col".
+    """
+    parts = text.rsplit(':', 2)
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        path, line, col = parts[0], int(parts[1]), int(parts[2])
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = -1
+        for _ in range(line - 1):
+            offset = data.find(b'\n', offset + 1)
+            if offset == -1:
+                raise ValueError('%s has less than %d lines' % (path, line))
+        return Target(os.path.abspath(path), offset + col, line, col)
+
+    path, _, offset = text.rpartition(':')
+    offset = offset.lstrip('#')
+    if not path or not offset.isdigit():
+        raise ValueError('invalid target %r, expected file:#offset or file:line:col' % text)
+    with open(path, 'rb') as f:
+        line, col = line_col(f.read(), int(offset))
+    return Target(os.path.abspath(path), int(offset), line, col)
+
+
+class Runner(object):
+    """ Runs one mode for many targets on a pool of guru processes.
+    """
+
+    def __init__(self, toolpath, mode, env=None, scope=None, tags='', auto_scope=False, jobs=4, progress=None,
+                 limits=None):
+        self.toolpath = toolpath
+        self.mode = mode
+        self.env = env if env is not None else dict(os.environ)
+        self.scope = scope
+        self.tags = tags
+        self.auto_scope = auto_scope
+        self.jobs = jobs
+        self.progress = progress
+        self.limits = limits
+        self.graphs = packages.GraphCache()
+        self._scopes = {}
+        self._lock = threading.Lock()
+        self._done = 0
+
+    def scope_for(self, target):
+        """ Returns the scope for the package of the target: --scope, the
+        packages importing it (auto scope) or the package itself.
+        """
+        if self.scope is not None:
+            return self.scope
+        directory = os.path.dirname(target.file)
+        with self._lock:
+            scope = self._scopes.get(directory)
+        if scope is not None:
+            return scope
+        scope = ''
+        root = packages.module_root(directory)
+        if packages.is_module(root):
+            go = process.resolve('go', self.env) or 'go'
+            graph = self.graphs.get(go, self.env, root, self.tags.split())
+            package = graph.package_for_dir(directory) or graph.package_for_dir(os.path.realpath(directory))
+            if package is not None:
+                scope = package
+                if self.auto_scope and self.mode in packages.POINTER_MODES:
+                    scope = ','.join(graph.scope_for(package))
+        else:
+            gopath = self.env.get('GOPATH') or os.path.expanduser('~/go')
+            scope = packages.gopath_package(gopath, directory)
+        with self._lock:
+            self._scopes[directory] = scope
+        return scope
+
+    def run_one(self, target, total):
+        cmd = query.command(self.toolpath, self.mode, query.position(target.file, target.offset),
+                            scope=self.scope_for(target), tags=self.tags, json_output=True)
+        procs = []
+        out, err, returncode = query.run(cmd, self.env, on_spawn=procs.append, limits=self.limits)
+        used = procs[0].usage or {}
+        decoder = JsonStreamDecoder()
+        records = decoder.feed(skip_query_object(out))
+        decoder.close()
+        if decoder.error is not None and returncode == 0:
+            err += "couldn't decode guru's JSON output: %s\n" % decoder.error
+
+        with self._lock:
+            self._done += 1
+            done = self._done
+        if self.progress is not None:
+            self.progress(done, total, target)
+        return {
+            'file': target.file,
+            'line': target.line,
+            'col': target.col,
+            'name': target.name,
+            'mode': self.mode,
+            'count': len(records),
+            'error': err.strip() if returncode != 0 else '',
+            'max_rss_kb': used.get('max_rss_kb'),
+            'cpu': round(used['user_cpu'] + used['sys_cpu'], 3) if used else None,
+            'results': [r.to_list() for r in records],
+        }
+
+    def run(self, targets):
+        """ Returns the report rows of 'targets', in their order.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            return list(pool.map(lambda t: self.run_one(t, len(targets)), targets))
+
+
+def write_json(rows, stream):
+    json.dump(rows, stream, indent=1)
+    stream.write('\n')
+
+
+def write_csv(rows, stream):
+    writer = csv.writer(stream)
+    writer.writerow(['file', 'line', 'col', 'name', 'mode', 'count', 'max_rss_kb', 'cpu', 'error'])
+    for row in rows:
+        writer.writerow([row['file'], row['line'], row['col'], row['name'], row['mode'], row['count'],
+                         row['max_rss_kb'], row['cpu'], row['error']])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m core.cli', description='Runs guru queries in batch.')
+    parser.add_argument('targets', nargs='*', metavar='TARGET', help='file:#offset, file:offset or file:line:col')
+    parser.add_argument('-m', '--mode', default='referrers', choices=query.MODES)
+    parser.add_argument('-e', '--exported', action='append', default=[], metavar='DIR',
+                        help='query every exported declaration of the Go files of DIR')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 2, help='guru processes run at once')
+    parser.add_argument('-s', '--scope', help='guru scope, the package of each target by default')
+    parser.add_argument('-a', '--auto-scope', action='store_true',
+                        help='use the main packages importing the target package as scope (pointer modes)')
+    parser.add_argument('-t', '--tags', default='', help='space separated build tags')
+    parser.add_argument('--guru', help='guru executable, looked up in PATH by default')
+    parser.add_argument('--timeout', type=float, default=0, help='seconds after which a guru is killed')
+    parser.add_argument('--memory', type=int, default=0, metavar='MB',
+                        help='resident memory (Linux) over which a guru is killed')
+    parser.add_argument('--nice', type=int, default=0, help='niceness increment of the guru processes')
+    parser.add_argument('-f', '--format', default='json', choices=('json', 'csv'))
+    parser.add_argument('-o', '--output', help='report file, stdout by default')
+    parser.add_argument('-u', '--unused', action='store_true', help='only report targets without results')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress on stderr')
+    args = parser.parse_args(argv)
+
+    targets = []
+    try:
+        for directory in args.exported:
+            targets.extend(exported(os.path.abspath(directory)))
+        targets.extend(parse_target(t) for t in args.targets)
+    except (OSError, IOError, ValueError) as e:
+        parser.error(str(e))
+    if not targets:
+        parser.error('no targets, pass TARGET arguments or --exported DIR')
+
+    env = dict(os.environ)
+    toolpath = args.guru or process.resolve('guru', env)
+    if toolpath is None:
+        parser.error("couldn't find guru in PATH, see the Dependencies section of the README")
+
+    def progress(done, total, target):
+        sys.stderr.write('[%d/%d] %s %s\n' % (done, total, args.mode, target.name or target.location()))
+        sys.stderr.flush()
+
+    runner = Runner(toolpath, args.mode, env=env, scope=args.scope, tags=args.tags, auto_scope=args.auto_scope,
+                    jobs=args.jobs, progress=None if args.quiet else progress,
+                    limits=process.Limits(timeout=args.timeout, memory=args.memory, nice=args.nice))
+    rows = runner.run(targets)
+    if args.unused:
+        rows = [r for r in rows if r['count'] == 0 and not r['error']]
+
+    write = write_csv if args.format == 'csv' else write_json
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write(rows, f)
+    else:
+        write(rows, sys.stdout)
+    return 1 if any(r['error'] for r in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+'go doc' lookups and their cache.
+
+Documentation only changes with the toolchain or the module dependencies,
+so entries are keyed by the go doc arguments, the directory it runs in (which
+resolves identifiers given without a package) and a fingerprint made of the
+go version and the hash of go.sum.
+"""
+
+import hashlib
+import os
+import re
+import subprocess
+import threading
+
+from . import process
+from .cache import LRUCache
+
+
+_versions = {}  # (go, mtime, GOROOT) -> go version output
+_sums = {}  # go.sum path -> (mtime, size, digest)
+_lock = threading.Lock()
+
+
+def toolchain_version(go, env):
+    """ Returns 'go version' for the go binary, run once per binary mtime.
+    """
+    try:
+        mtime = os.stat(go).st_mtime
+    except OSError:
+        mtime = None
+    key = (go, mtime, env.get('GOROOT'))
+    with _lock:
+        version = _versions.get(key)
+    if version is None:
+        proc = process.spawn([go, 'version'], env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        version = proc.communicate()[0].decode('utf-8', 'replace').strip()
+        with _lock:
+            _versions[key] = version
+    return version
+
+
+def module_sum(module_root):
+    """ Returns a digest of the module's go.sum ('' without one), hashed
+    again only when the file changes.
+    """
+    path = os.path.join(module_root, 'go.sum')
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ''
+    with _lock:
+        cached = _sums.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[2]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    with _lock:
+        _sums[path] = (st.st_mtime, st.st_size, digest)
+    return digest
+
+
+def fingerprint(go, env, module_root):
+    return (toolchain_version(go, env), env.get('GOFLAGS', ''), module_sum(module_root))
+
+
+def run(go, env, args, cwd=None, job=None):
+    """ Runs 'go doc args' and returns (out, err, returncode), None when the
+    scheduler 'job' got cancelled.
+    """
+    proc = process.spawn([go, 'doc'] + list(args), env=env, cwd=cwd,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    if job is not None and not job.attach(proc):
+        return None
+    out, err = proc.communicate()
+    if job is not None and job.cancelled:
+        return None
+    return out.decode('utf-8', 'replace'), err.decode('utf-8', 'replace'), proc.returncode
+
+
+def format_doc(doc, definition_line):
+    """ Comments the non go code of the documentation, then adds the line
+    of the definition.
+    """
+    lines = []
+    for line in doc.splitlines():
+        if line[0:4] == '    ':
+            lines.append('//' + line)
+        else:
+            lines.append(line)
+    lines.append(definition_line)
+    return '\n'.join(lines) + '\n'
+
+
+_IMPORT_BLOCK = re.compile(r'^import\s*\(([^)]*)\)', re.MULTILINE)
+_IMPORT_LINE = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.MULTILINE)
+_IMPORT_SPEC = re.compile(r'^\s*(?:[\w.]+\s+)?"([^"]+)"', re.MULTILINE)
+
+
+def parse_imports(text):
+    """ Returns the import paths of the Go source 'text'.
+    """
+    imports = _IMPORT_LINE.findall(text)
+    for block in _IMPORT_BLOCK.findall(text):
+        imports.extend(_IMPORT_SPEC.findall(block))
+    return [i for i in imports if i != 'C']
+
+
+class DocCache(LRUCache):
+    """ LRU cache of formatted documentation.
+    """
@@ -0,0 +1,342 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Minimal LSP (JSON-RPC over stdio) client used to talk to a long lived gopls.
+
+Only what GoGuru needs is implemented: the initialize handshake, document
+synchronization (incremental, a change is sent as the single range that
+differs from what the server last got) and a handful of requests whose answers are rendered in the
+same plain text format guru uses, so the rest of the plugin (result
+navigation, jump to definition) works unchanged.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from urllib.parse import quote, unquote, urlparse
+
+
+# guru modes that can be answered by gopls
+MODES = ('definition', 'describe', 'implements', 'referrers', 'callers', 'callees')
+
+
+class LspError(Exception):
+    pass
+
+
+def path_to_uri(path):
+    path = os.path.abspath(path).replace('\\', '/')
+    if not path.startswith('/'):
+        path = '/' + path
+    return 'file://' + quote(path)
+
+
+def uri_to_path(uri):
+    path = unquote(urlparse(uri).path)
+    if sys.platform == 'win32' and path[:1] == '/' and path[2:3] == ':':
+        path = path[1:].replace('/', '\\')
+    return path
+
+
+def utf16_len(text):
+    """ Length of 'text' in utf-16 code units, the LSP column unit.
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def common_prefix(a, b):
+    """ Length of the longest common prefix of 'a' and 'b', found by
+    comparing slices so big buffers aren't walked character by character.
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def common_suffix(a, b, limit):
+    """ Length of the longest common suffix of 'a' and 'b', at most 'limit'.
+    """
+    low, high = 0, min(len(a), len(b), limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def lsp_position(text, offset):
+    """ The LSP (line, utf-16 character) position of the character 'offset'
+    of 'text'.
+    """
+    line = text.count('\n', 0, offset)
+    start = text.rfind('\n', 0, offset) + 1
+    return {'line': line, 'character': utf16_len(text[start:offset])}
+
+
+def text_change(old, new):
+    """ Returns the contentChanges entry turning 'old' into 'new', None
+    when they are equal.
+    """
+    if old == new:
+        return None
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return {
+        'range': {'start': lsp_position(old, prefix), 'end': lsp_position(old, len(old) - suffix)},
+        'text': new[prefix:len(new) - suffix],
+    }
+
+
+class LspClient(object):
+    """ A language server process and the JSON-RPC session with it.
+    """
+
+    def __init__(self, argv, root, env=None, timeout=30):
+        self.argv = argv
+        self.root = root
+        self.env = env
+        self.timeout = timeout
+        self.proc = None
+        self.documents = {}  # uri -> (version, text)
+        self.incremental = False
+        self._next_id = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._documents_lock = threading.Lock()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        """ Starts the server and runs the initialize handshake, the server
+        is killed when the handshake fails.
+        """
+        self.proc = subprocess.Popen(
+            self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=self.env, cwd=self.root)
+        reader = threading.Thread(target=self._read_loop, name='GoGuru-lsp-reader')
+        reader.daemon = True
+        reader.start()
+
+        try:
+            self._initialize()
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+            raise
+
+    def _initialize(self):
+        result = self.request('initialize', {
+            'processId': os.getpid(),
+            'rootUri': path_to_uri(self.root),
+            'workspaceFolders': [{'uri': path_to_uri(self.root), 'name': os.path.basename(self.root)}],
+            'capabilities': {
+                'textDocument': {
+                    'synchronization': {'didSave': False},
+                    'hover': {'contentFormat': ['plaintext']},
+                    'callHierarchy': {},
+                },
+            },
+        })
+        sync = (result or {}).get('capabilities', {}).get('textDocumentSync')
+        # either a TextDocumentSyncKind or TextDocumentSyncOptions
+        kind = sync.get('change') if isinstance(sync, dict) else sync
+        self.incremental = kind == 2
+        self.notify('initialized', {})
+
+    def shutdown(self):
+        if not self.alive():
+            return
+        try:
+            self.request('shutdown', None, timeout=2)
+            self.notify('exit', None)
+            self.proc.stdin.close()
+            self.proc.wait(2)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+    # transport
+
+    def _send(self, message):
+        body = json.dumps(message).encode('utf-8')
+        with self._write_lock:
+            self.proc.stdin.write(('Content-Length: %d\r\n\r\n' % len(body)).encode('ascii'))
+            self.proc.stdin.write(body)
+            self.proc.stdin.flush()
+
+    def _read_loop(self):
+        stdout = self.proc.stdout
+        while True:
+            length = None
+            while True:
+                line = stdout.readline()
+                if not line:
+                    self._fail_pending('language server exited')
+                    return
+                line = line.strip()
+                if not line:
+                    break
+                name, _, value = line.partition(b':')
+                if name.lower() == b'content-length':
+                    length = int(value)
+            if length is None:
+                continue
+            message = json.loads(stdout.read(length).decode('utf-8'))
+            self._dispatch(message)
+
+    def _dispatch(self, message):
+        if 'method' in message:
+            if 'id' in message:
+                self._answer_server_request(message)
+            return
+        with self._lock:
+            slot = self._pending.pop(message.get('id'), None)
+        if slot is not None:
+            slot['message'] = message
+            slot['event'].set()
+
+    def _answer_server_request(self, message):
+        result = None
+        if message['method'] == 'workspace/configuration':
+            result = [None] * len(message.get('params', {}).get('items', []))
+        self._send({'jsonrpc': '2.0', 'id': message['id'], 'result': result})
+
+    def _fail_pending(self, reason):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot['message'] = {'error': {'message': reason}}
+            slot['event'].set()
+
+    def request(self, method, params, timeout=None):
+        """ Sends a request and blocks until its result arrives.
+        """
+        slot = {'event': threading.Event(), 'message': None}
+        with self._lock:
+            self._next_id += 1
+            msg_id = self._next_id
+            self._pending[msg_id] = slot
+        self._send({'jsonrpc': '2.0', 'id': msg_id, 'method': method, 'params': params})
+        if not slot['event'].wait(timeout or self.timeout):
+            with self._lock:
+                self._pending.pop(msg_id, None)
+            raise LspError('%s timed out' % method)
+        message = slot['message']
+        if 'error' in message:
+            raise LspError('%s: %s' % (method, message['error'].get('message')))
+        return message.get('result')
+
+    def notify(self, method, params):
+        self._send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    # documents
+
+    def sync(self, path, text, version):
+        """ Makes the server see 'text' as the contents of 'path', only sending
+        it when 'version' changed since the last sync, as the range that
+        changed when the server accepts incremental changes.
+        """
+        uri = path_to_uri(path)
+        with self._documents_lock:
+            known = self.documents.get(uri)
+            if known is not None and known[0] == version:
+                return
+            if known is None:
+                self.notify('textDocument/didOpen', {'textDocument': {
+                    'uri': uri, 'languageId': 'go', 'version': version, 'text': text}})
+            else:
+                change = text_change(known[1], text) if self.incremental else {'text': text}
+                if change is not None:
+                    self.notify('textDocument/didChange', {
+                        'textDocument': {'uri': uri, 'version': version},
+                        'contentChanges': [change]})
+            self.documents[uri] = (version, text)
+
+    def synced(self):
+        """ Paths of the documents the server got from us.
+        """
+        with self._documents_lock:
+            return [uri_to_path(uri) for uri in self.documents]
+
+    def close_document(self, path):
+        uri = path_to_uri(path)
+        with self._documents_lock:
+            if self.documents.pop(uri, None) is not None:
+                self.notify('textDocument/didClose', {'textDocument': {'uri': uri}})
+
+    # queries
+
+    def query(self, mode, path, line, character):
+        """ Runs the request matching the guru 'mode' at the 0-based
+        (line, utf-16 character) position and returns guru like plain text.
+        """
+        position = {'textDocument': {'uri': path_to_uri(path)}, 'position': {'line': line, 'character': character}}
+
+        if mode == 'definition':
+            return format_locations(self.request('textDocument/definition', position), 'defined here')
+        if mode == 'implements':
+            return format_locations(self.request('textDocument/implementation', position), 'implementation')
+        if mode == 'referrers':
+            position['context'] = {'includeDeclaration': True}
+            return format_locations(self.request('textDocument/references', position), 'reference')
+        if mode == 'describe':
+            return format_hover(path, line, character, self.request('textDocument/hover', position))
+        if mode in ('callers', 'callees'):
+            items = self.request('textDocument/prepareCallHierarchy', position) or []
+            lines = []
+            for item in items:
+                if mode == 'callers':
+                    calls = self.request('callHierarchy/incomingCalls', {'item': item}) or []
+                    lines.extend(format_call(c['from'], '%s is called from this function' % item['name']) for c in calls)
+                else:
+                    calls = self.request('callHierarchy/outgoingCalls', {'item': item}) or []
+                    lines.extend(format_call(c['to'], 'called by %s' % item['name']) for c in calls)
+            return '\n'.join(lines) + '\n' if lines else ''
+        raise LspError('mode %s is not supported by gopls' % mode)
+
+
+def format_position(uri, position):
+    return '%s:%d:%d' % (uri_to_path(uri), position['line'] + 1, position['character'] + 1)
+
+
+def format_locations(locations, description):
+    if not locations:
+        return ''
+    if isinstance(locations, dict):
+        locations = [locations]
+    lines = []
+    for loc in locations:
+        uri = loc.get('uri') or loc.get('targetUri')
+        rng = loc.get('range') or loc.get('targetSelectionRange')
+        lines.append('%s: %s' % (format_position(uri, rng['start']), description))
+    return '\n'.join(lines) + '\n'
+
+
+def format_call(item, description):
+    return '%s: %s %s' % (format_position(item['uri'], item['selectionRange']['start']), description, item['name'])
+
+
+def format_hover(path, line, character, hover):
+    if not hover:
+        return ''
+    contents = hover.get('contents')
+    if isinstance(contents, dict):
+        text = contents.get('value', '')
+    elif isinstance(contents, list):
+        text = '\n'.join(c.get('value', '') if isinstance(c, dict) else c for c in contents)
+    else:
+        text = contents or ''
+    where = '%s:%d:%d' % (path, line + 1, character + 1)
+    return '\n'.join('%s: %s' % (where, l) for l in text.strip().splitlines()) + '\n'
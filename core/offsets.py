@@ -0,0 +1,107 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Character offset to byte offset conversion.
+
+guru expects byte offsets into the file as it is stored on disk, the editor
+works with character offsets. Instead of mapping every character of the
+buffer we keep, per line, its length in characters and in bytes (including
+the line terminator, so CRLF files are accounted for). Line starts are prefix
+sums of those lengths, recomputed lazily from the first edited line.
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain
+
+
+class LineIndex(object):
+    """ Line start index of a buffer, in characters and in bytes.
+    """
+
+    def __init__(self, text, crlf=False, data=None):
+        self.crlf = crlf
+        self.change_count = None
+        self.rebuild(text, data)
+
+    def rebuild(self, text, data=None):
+        """ Recomputes the whole index from the buffer text. 'data', when
+        given, is that text already encoded as it is saved (line endings
+        included), so it isn't encoded again.
+        """
+        lines = text.split('\n')
+        # the lines of 'data' keep their '\r', the ones encoded here have none
+        eol = 1 if data is not None or not self.crlf else 2
+        if data is None:
+            data = text.encode('utf-8')
+        self.char_len = array('q', (len(l) + 1 for l in lines))
+        self.byte_len = array('q', (len(l) + eol for l in data.split(b'\n')))
+        # the last line has no terminator
+        self.char_len[-1] -= 1
+        self.byte_len[-1] -= eol
+        self.char_starts = None
+        self.byte_starts = None
+        self.dirty_from = 0
+
+    def lines(self):
+        return len(self.char_len)
+
+    def replace(self, a_row, a_col, a_col_bytes, b_row, b_col, b_col_bytes, text):
+        """ Applies an edit that replaced the text between (a_row, a_col) and
+        (b_row, b_col) with 'text'. Columns are given both in characters and
+        in utf-8 bytes.
+        """
+        eol = 2 if self.crlf else 1
+        tail_chars = self.char_len[b_row] - b_col
+        tail_bytes = self.byte_len[b_row] - b_col_bytes
+
+        pieces = text.split('\n')
+        chars = [len(p) + 1 for p in pieces]
+        nbytes = [len(p.encode('utf-8')) + eol for p in pieces]
+        chars[0] += a_col
+        nbytes[0] += a_col_bytes
+        chars[-1] += tail_chars - 1
+        nbytes[-1] += tail_bytes - eol
+
+        self.char_len[a_row:b_row + 1] = array('q', chars)
+        self.byte_len[a_row:b_row + 1] = array('q', nbytes)
+        self.dirty_from = min(self.dirty_from, a_row + 1)
+
+    def _refresh(self):
+        if self.char_starts is None:
+            start = 0
+        elif self.dirty_from >= len(self.char_len) and len(self.char_starts) == len(self.char_len):
+            return
+        else:
+            start = max(0, min(self.dirty_from, len(self.char_starts), len(self.char_len)) - 1)
+        char_base = self.char_starts[start] if start else 0
+        byte_base = self.byte_starts[start] if start else 0
+        if start == 0:
+            self.char_starts = array('q')
+            self.byte_starts = array('q')
+        else:
+            del self.char_starts[start:]
+            del self.byte_starts[start:]
+        self.char_starts.extend(accumulate(chain((char_base,), self.char_len[start:-1])))
+        self.byte_starts.extend(accumulate(chain((byte_base,), self.byte_len[start:-1])))
+        self.dirty_from = len(self.char_len)
+
+    def locate(self, point):
+        """ Returns (row, line character start, line byte start) for 'point'.
+        """
+        if point < 0:
+            raise ValueError('point %d is before the beginning of the buffer' % point)
+        self._refresh()
+        row = bisect_right(self.char_starts, point) - 1
+        return row, self.char_starts[row], self.byte_starts[row]
+
+    def byte_offset(self, point, substr):
+        """ Converts the character offset 'point' to a byte offset.
+        'substr(begin, end)' must return the buffer text in that range,
+        only the part of the line before 'point' is requested.
+        """
+        row, char_start, byte_start = self.locate(point)
+        if point == char_start:
+            return byte_start
+        return byte_start + len(substr(char_start, point).encode('utf-8'))
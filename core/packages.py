@@ -0,0 +1,375 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Packages of a project, as reported by 'go list'.
+
+One 'go list -deps' pass per module gives the directory of every package the
+module builds (its own and its dependencies) and the transitive imports of
+its main packages. From it import paths are resolved with a dict lookup and
+the smallest scope guru's pointer analysis needs is derived: the main
+packages that (transitively) import the queried package.
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+
+from . import process
+from .cache import make_key
+
+
+# modes whose cost grows with the analysis scope
+POINTER_MODES = ('callers', 'callees', 'callstack', 'pointsto', 'peers', 'whicherrs')
+
+LIST_FIELDS = 'ImportPath,Dir,Name,Deps'
+
+# files whose changes alter the package graph of a module
+MODULE_FILES = ('go.mod', 'go.sum', 'go.work', 'go.work.sum')
+
+
+def module_root(directory):
+    """ Returns the closest parent directory holding a go.work, like the go
+    command the workspace takes precedence over the module it contains,
+    else the closest one holding a go.mod, 'directory' itself if there is
+    none.
+    """
+    module = None
+    current = directory
+    while True:
+        if os.path.isfile(os.path.join(current, 'go.work')):
+            return current
+        if module is None and os.path.isfile(os.path.join(current, 'go.mod')):
+            module = current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return module or directory
+        current = parent
+
+
+def workspace_modules(root):
+    """ Returns the module directories the go.work at 'root' uses, None when
+    there is no go.work.
+    """
+    try:
+        with open(os.path.join(root, 'go.work')) as f:
+            lines = f.read().splitlines()
+    except (OSError, IOError):
+        return None
+    dirs = []
+    block = False
+    for line in lines:
+        line = line.split('//')[0].strip()
+        if block:
+            if line == ')':
+                block = False
+            elif line:
+                dirs.append(line.strip('"'))
+        elif line.startswith('use'):
+            rest = line[3:].strip()
+            if rest == '(':
+                block = True
+            elif rest and line[3:4] in ' \t"':
+                dirs.append(rest.strip('"'))
+    return [os.path.normpath(os.path.join(root, d)) for d in dirs]
+
+
+def is_module(root):
+    return any(os.path.isfile(os.path.join(root, name)) for name in ('go.mod', 'go.work'))
+
+
+class PackageGraph(object):
+    """ Packages of a project with the transitive dependencies of its main
+    packages. 'packages' are [import path, dir, name, deps] lists, deps
+    being only kept for main packages. 'state' identifies the mtimes of the
+    files the graph was built from, see GraphCache.
+    """
+
+    def __init__(self, packages, error=None):
+        self.packages = packages
+        self.error = error
+        self.state = None
+        self._dirs = {}  # directory -> import path
+        self._paths = {}  # import path -> directory
+        self._mains_by_dep = {}  # import path -> main packages depending on it
+        for path, directory, name, deps in packages:
+            if directory:
+                self._dirs[os.path.normcase(directory)] = path
+                self._paths[path] = directory
+            if name == 'main':
+                for dep in [path] + (deps or []):
+                    self._mains_by_dep.setdefault(dep, []).append(path)
+
+    @classmethod
+    def from_json(cls, values):
+        """ Builds the graph from decoded 'go list -json' output.
+        """
+        packages = []
+        for pkg in values:
+            if pkg.get('ImportPath'):
+                deps = pkg.get('Deps', []) if pkg.get('Name') == 'main' else None
+                packages.append([pkg['ImportPath'], pkg.get('Dir', ''), pkg.get('Name', ''), deps])
+        return cls(packages)
+
+    def package_for_dir(self, directory):
+        return self._dirs.get(os.path.normcase(directory))
+
+    def dir_for_package(self, import_path):
+        return self._paths.get(import_path)
+
+    def scope_for(self, import_path):
+        """ Returns the main packages importing 'import_path', or the package
+        itself when no main package does.
+        """
+        return sorted(self._mains_by_dep.get(import_path, [import_path]))
+
+    def module_dirs(self, root):
+        """ Directories of the packages under 'root' and their parents up to
+        it, a package appearing or going away changes one of their mtimes.
+        """
+        root = os.path.normcase(os.path.abspath(root))
+        dirs = set([root])
+        for directory in self._dirs:
+            if not directory.startswith(root + os.sep):
+                continue
+            while directory not in dirs:
+                dirs.add(directory)
+                directory = os.path.dirname(directory)
+        return dirs
+
+    def __len__(self):
+        return len(self.packages)
+
+
+def list_packages(go, env, root, patterns=('./...',), tags=None, extra=()):
+    """ Runs 'go list -json' in root and returns the decoded packages.
+    """
+    args = ['list', '-e']
+    if tags:
+        args.extend(['-tags', ' '.join(tags)])
+    args.extend(extra)
+    proc = process.spawn([go] + args + ['-json=' + LIST_FIELDS] + list(patterns), env=env, cwd=root,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    out, err = proc.communicate()
+    if proc.returncode != 0 and b'-json' in err:
+        # toolchains before go1.19 can't select fields ('invalid boolean value
+        # "..." for -json')
+        proc = process.spawn([go] + args + ['-json'] + list(patterns), env=env, cwd=root,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        out, err = proc.communicate()
+    if proc.returncode != 0 and not out:
+        raise RuntimeError('go list failed: %s' % err.decode('utf-8', 'replace').strip())
+    return decode_stream(out.decode('utf-8', 'replace'))
+
+
+def decode_stream(text):
+    """ Decodes a sequence of concatenated JSON values.
+    """
+    decoder = json.JSONDecoder()
+    values = []
+    i = 0
+    n = len(text)
+    while True:
+        while i < n and text[i].isspace():
+            i += 1
+        if i == n:
+            return values
+        value, i = decoder.raw_decode(text, i)
+        values.append(value)
+
+
+def _mtime(path):
+    """ mtime of 'path', for a directory the newest of its own and of its
+    .go files: files saved in place (adding an import) leave the directory
+    mtime alone.
+    """
+    mtime = os.stat(path).st_mtime
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if name.endswith('.go'):
+                try:
+                    mtime = max(mtime, os.stat(os.path.join(path, name)).st_mtime)
+                except OSError:
+                    pass
+    return mtime
+
+
+def dir_state(directory):
+    """ Returns the newest mtime of 'directory' and its .go files, None when
+    it is gone.
+    """
+    try:
+        return _mtime(directory)
+    except OSError:
+        return None
+
+
+def _mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = _mtime(path)
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+class GraphCache(object):
+    """ PackageGraph per (project root, build tags, go environment), kept in
+    memory and, with a 'directory', on disk. A graph is rebuilt when the
+    module files, the package directories or their .go files change, they
+    are checked at most every 'check_interval' seconds: the module files
+    on the spot, the directories (a walk of the module) in the background
+    while the graph keeps being used.
+    """
+
+    def __init__(self, directory=None, check_interval=2):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._graphs = {}  # key -> (mtimes, checked at, graph)
+        self._lock = threading.Lock()
+        self._building = {}
+        self._checking = set()
+
+    def get(self, go, env, root, tags=None):
+        """ Returns the graph of the project at 'root', an empty graph with
+        an 'error' when go list failed (retried once something changes).
+        """
+        key = make_key(root, list(tags or ()), go, env.get('GOFLAGS', ''), env.get('GOPATH', ''))
+        graph = self._cached(key)
+        if graph is not None:
+            return graph
+        # one build per project at a time, the others wait for it
+        with self._lock:
+            lock = self._building.setdefault(key, threading.Lock())
+        with lock:
+            graph = self._cached(key)
+            if graph is None:
+                graph = self._load(key)
+            if graph is not None:
+                return graph
+
+            # ./... of a workspace root only matches what isn't in a module
+            patterns = ('./...',)
+            files = [os.path.join(root, name) for name in MODULE_FILES]
+            modules = workspace_modules(root)
+            if modules is not None:
+                patterns = [os.path.join(m, '...') for m in modules]
+                files.extend(os.path.join(m, name) for m in modules for name in ('go.mod', 'go.sum'))
+            before = _mtimes(files)
+            try:
+                graph = PackageGraph.from_json(list_packages(go, env, root, patterns, tags=tags, extra=('-deps',)))
+            except Exception as e:
+                graph = PackageGraph([], error=e)
+            mtimes = _mtimes(graph.module_dirs(root))
+            # taken before the run, an edit during it triggers a rebuild
+            mtimes.update(before)
+            graph.state = make_key(mtimes)
+            with self._lock:
+                self._graphs[key] = (mtimes, time.time(), graph)
+            if graph.error is None:
+                self._store(key, mtimes, graph)
+            return graph
+
+    def _cached(self, key):
+        with self._lock:
+            cached = self._graphs.get(key)
+        if cached is None:
+            return None
+        mtimes, checked, graph = cached
+        if time.time() - checked < self.check_interval:
+            return graph
+        files = dict((path, mtime) for path, mtime in mtimes.items() if os.path.basename(path) in MODULE_FILES)
+        if _mtimes(files) != files:
+            self._drop(key, graph)
+            return None
+        with self._lock:
+            self._graphs[key] = (mtimes, time.time(), graph)
+            if key in self._checking:
+                return graph
+            self._checking.add(key)
+        thread = threading.Thread(target=self._check, args=(key, mtimes, graph), name='GoGuru-graph-check')
+        thread.daemon = True
+        thread.start()
+        return graph
+
+    def _check(self, key, mtimes, graph):
+        try:
+            if _mtimes(mtimes) != mtimes:
+                self._drop(key, graph)
+        finally:
+            with self._lock:
+                self._checking.discard(key)
+
+    def _drop(self, key, graph):
+        with self._lock:
+            cached = self._graphs.get(key)
+            if cached is not None and cached[2] is graph:
+                del self._graphs[key]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                mtimes, packages = json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+        if _mtimes(mtimes) != mtimes:
+            return None
+        graph = PackageGraph(packages)
+        graph.state = make_key(mtimes)
+        with self._lock:
+            self._graphs[key] = (mtimes, time.time(), graph)
+        return graph
+
+    def _store(self, key, mtimes, graph):
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp = path + '.tmp%d' % threading.get_ident()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump([mtimes, graph.packages], f)
+            os.replace(tmp, path)
+        except (OSError, IOError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+_gopaths = {}  # GOPATH -> real paths of its src directories
+
+
+def gopath_package(gopath, directory):
+    """ Returns the import path of 'directory' in GOPATH mode, '' when it
+    is outside of the GOPATH.
+    """
+    sources = _gopaths.get(gopath)
+    if sources is None:
+        sources = [os.path.join(os.path.realpath(p), 'src') for p in gopath.split(os.pathsep) if p]
+        _gopaths[gopath] = sources
+    directory = os.path.realpath(directory)
+    for src in sources:
+        if directory.startswith(src + os.sep):
+            return os.path.relpath(directory, src).replace(os.sep, '/')
+    return ''
@@ -0,0 +1,26 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Results of queries run speculatively while the cursor rests on an identifier.
+
+Entries are keyed by (buffer id, change count, identifier start, mode), so
+an edit makes them unreachable and they are dropped with the buffer.
+"""
+
+from .cache import LRUCache
+
+
+class PrefetchStore(LRUCache):
+    """ Small LRU store of prefetched (out, err, records) results.
+    """
+
+    def __init__(self, max_entries=32):
+        super().__init__(max_entries)
+
+    def discard_buffer(self, buffer_id):
+        """ Drops the entries of a buffer (edited or closed).
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == buffer_id]:
+                del self._entries[key]
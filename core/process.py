@@ -0,0 +1,275 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Helpers to start child processes (without a shell, in their own process
+group, within Limits), to resolve the tools they run and to kill them
+together with everything they spawned.
+"""
+
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+# (tool, PATH) -> (absolute path, mtime)
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def resolve(name, env=None):
+    """ Returns the absolute path of the executable 'name' looked up in the
+    PATH of 'env' (os.environ when None), None when it can't be found.
+    The result is cached and trusted while the file's mtime doesn't change.
+    """
+    if os.path.isabs(name):
+        return name
+    path = (env if env is not None else os.environ).get('PATH', os.defpath)
+    key = (name, path)
+    with _resolved_lock:
+        cached = _resolved.get(key)
+    if cached is not None:
+        try:
+            if os.stat(cached[0]).st_mtime == cached[1]:
+                return cached[0]
+        except OSError:
+            pass
+
+    found = shutil.which(name, path=path)
+    if found is None:
+        with _resolved_lock:
+            _resolved.pop(key, None)
+        return None
+    found = os.path.abspath(found)
+    with _resolved_lock:
+        _resolved[key] = (found, os.stat(found).st_mtime)
+    return found
+
+
+class Limits(object):
+    """ What a child process may use: 'timeout' seconds of wall-clock time,
+    'memory' MB of resident memory (Linux), 'address_space' MB of virtual
+    memory (RLIMIT_AS), and how much it gives way to the editor: its 'nice'
+    increment and 'ionice' class (Linux: 2 best-effort, 3 idle). 0 leaves
+    each one alone.
+    """
+
+    FIELDS = ('timeout', 'memory', 'address_space', 'nice', 'ionice')
+
+    def __init__(self, timeout=0, memory=0, address_space=0, nice=0, ionice=0):
+        self.timeout = timeout
+        self.memory = memory
+        self.address_space = address_space
+        self.nice = nice
+        self.ionice = ionice
+
+    @classmethod
+    def for_mode(cls, limits, mode):
+        """ Returns the Limits of 'mode' from a {mode: {field: value}}
+        setting, whose "*" entry applies to every mode.
+        """
+        merged = dict(limits.get('*', {}))
+        merged.update(limits.get(mode, {}))
+        return cls(**dict((k, v) for k, v in merged.items() if k in cls.FIELDS))
+
+    def watched(self):
+        return bool(self.timeout or self.memory)
+
+    def __repr__(self):
+        return 'Limits(%s)' % ', '.join('%s=%r' % (f, getattr(self, f)) for f in self.FIELDS if getattr(self, f))
+
+
+def spawn(argv, env=None, limits=None, **kwargs):
+    """ Starts argv (no shell involved) in a new process group, within
+    'limits' (see Limits, the time and memory ones are enforced by
+    Watchdog). The time spent starting it is available as the
+    'spawn_seconds' attribute.
+    """
+    kwargs.update(group_kwargs())
+    if limits is not None and sys.platform != 'win32':
+        argv, preexec = _restrict(argv, env, limits)
+        if preexec is not None:
+            kwargs['preexec_fn'] = preexec
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, env=env, **kwargs)
+    proc.spawn_seconds = time.perf_counter() - start
+    if limits is not None and sys.platform != 'win32':
+        _limit(proc, limits)
+    return proc
+
+
+def _restrict(argv, env, limits):
+    """ Returns the argv (wrapped by ionice) and the preexec_fn (None when
+    the limits can be set from here after the start) applying 'limits'.
+    """
+    if limits.ionice and sys.platform.startswith('linux'):
+        ionice = resolve('ionice', env)
+        if ionice is not None:
+            # -t: still run it when the class can't be set
+            argv = [ionice, '-c', str(limits.ionice), '-t'] + list(argv)
+    # Python < 3.4 lacks prlimit, setrlimit has to run in the child
+    address_space = limits.address_space if not hasattr(_resource(), 'prlimit') else 0
+    if not limits.nice and not address_space:
+        return argv, None
+
+    # in the child before exec, so every thread of guru inherits the nice level
+    def preexec():
+        if limits.nice:
+            try:
+                os.nice(limits.nice)
+            except OSError:
+                pass
+        if address_space:
+            _set_address_space(None, address_space)
+    return argv, preexec
+
+
+def _limit(proc, limits):
+    try:
+        if limits.address_space and hasattr(_resource(), 'prlimit'):
+            _set_address_space(proc.pid, limits.address_space)
+    except (OSError, ValueError, AttributeError):
+        # exited already, or the platform lacks them
+        pass
+
+
+def _resource():
+    import resource
+    return resource
+
+
+def _set_address_space(pid, mb):
+    resource = _resource()
+    limit = (mb * 1024 * 1024, mb * 1024 * 1024)
+    if pid is None:
+        resource.setrlimit(resource.RLIMIT_AS, limit)
+    else:
+        resource.prlimit(pid, resource.RLIMIT_AS, limit)
+
+
+def resident_kb(pid):
+    """ Returns the resident memory of process 'pid' in KB, None when it
+    can't be read (only Linux is supported).
+    """
+    try:
+        with open('/proc/%d/statm' % pid) as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IOError, ValueError, IndexError):
+        return None
+    return pages * (os.sysconf('SC_PAGE_SIZE') // 1024)
+
+
+# how a Go program reports that it couldn't get more memory
+OUT_OF_MEMORY = re.compile(r'out of memory|cannot allocate memory', re.IGNORECASE)
+
+
+class Watchdog(object):
+    """ Kills 'proc' and its process group once it runs longer than the
+    'limits' timeout or its resident memory goes over the memory limit,
+    'tripped' then describes which one. Must be stopped (stop) before the
+    process is waited for.
+    """
+
+    def __init__(self, proc, limits, interval=0.2):
+        self.proc = proc
+        self.limits = limits
+        self.interval = interval
+        self.tripped = None
+        self._started = time.perf_counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _watch(self):
+        limits = self.limits
+        while not self._stopped.wait(self.interval):
+            if self.proc.returncode is not None:
+                return
+            if limits.timeout and time.perf_counter() - self._started > limits.timeout:
+                self._trip('it ran longer than the %gs timeout' % limits.timeout)
+                return
+            if limits.memory:
+                rss = resident_kb(self.proc.pid)
+                if rss is not None and rss > limits.memory * 1024:
+                    self._trip('its resident memory (%dMB) went over the %dMB limit' % (rss // 1024, limits.memory))
+                    return
+
+    def _trip(self, reason):
+        self.tripped = reason
+        kill_tree(self.proc)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def explain(proc, limits, watchdog, err):
+    """ Returns why 'proc' (within 'limits', under 'watchdog') was stopped
+    by a limit, None when it wasn't.
+    """
+    if watchdog is not None and watchdog.tripped is not None:
+        return watchdog.tripped
+    if limits is not None and limits.address_space and proc.returncode != 0 and OUT_OF_MEMORY.search(err):
+        return 'it ran out of its %dMB address space limit' % limits.address_space
+    return None
+
+
+def wait(proc):
+    """ Waits for 'proc' like proc.wait() and also collects its resource
+    usage through wait4, available as the 'usage' attribute (a dict with
+    max_rss_kb, user_cpu, sys_cpu, major_faults and minor_faults), None
+    when the platform doesn't report it or the process was already reaped.
+    """
+    proc.usage = None
+    if not hasattr(os, 'wait4') or proc.returncode is not None:
+        return proc.wait()
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except OSError:
+        # reaped meanwhile (by Popen)
+        return proc.wait()
+    if proc.returncode is None:
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+    # bytes on macOS, kilobytes elsewhere
+    max_rss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    proc.usage = {
+        'max_rss_kb': max_rss,
+        'user_cpu': round(rusage.ru_utime, 3),
+        'sys_cpu': round(rusage.ru_stime, 3),
+        'major_faults': rusage.ru_majflt,
+        'minor_faults': rusage.ru_minflt,
+    }
+    return proc.returncode
+
+
+def group_kwargs():
+    """ Popen keyword arguments that put the child in a new process group.
+    """
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def kill_tree(proc):
+    """ Kills 'proc' and its descendants, the process must have been started
+    with group_kwargs(). It isn't reaped here, see wait.
+    """
+    if proc.returncode is not None:
+        return
+    try:
+        if sys.platform == 'win32':
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(proc.pid)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
@@ -0,0 +1,84 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+guru command lines and runs, shared by the plugin and the command line tool.
+"""
+
+import subprocess
+import threading
+
+from . import archive, process
+from .stream import read_text
+
+
+MODES = ('callees', 'callers', 'callstack', 'definition', 'describe', 'freevars', 'implements',
+         'peers', 'pointsto', 'referrers', 'what', 'whicherrs')
+
+
+def position(file_path, end_offset, begin_offset=None):
+    """ Returns guru's "file:#offset" (or "file:#begin,#end") position, in bytes.
+    """
+    if begin_offset is None:
+        return '%s:#%d' % (file_path, end_offset)
+    return '%s:#%d,#%d' % (file_path, begin_offset, end_offset)
+
+
+def command(toolpath, mode, pos, scope='', tags='', json_output=False, modified=False):
+    """ Returns the guru command line running 'mode' at 'pos', 'scope' and
+    'tags' being guru's comma and space separated lists.
+    """
+    cmd = [toolpath]
+    if modified:
+        cmd.append('-modified')
+    if scope:
+        cmd.extend(['-scope', scope])
+    cmd.extend(['-tags', tags])
+    if json_output:
+        cmd.append('-json')
+    cmd.extend([mode, pos])
+    return cmd
+
+
+def run(cmd, env=None, files=(), job=None, on_text=None, keep=True, cwd=None, on_spawn=None, limits=None):
+    """ Runs guru and returns its (out, err, returncode), None when the
+    scheduler 'job' got cancelled. 'files' (file name, contents bytes) are
+    sent as the -modified archive, 'on_text' gets the output as it arrives
+    and 'out' is only kept with 'keep'. 'on_spawn(proc)' is called once
+    guru started, its resource usage is then left in proc.usage (see
+    process.wait). Guru runs within the process.Limits 'limits', when one
+    of them stops it 'err' tells which and proc.tripped keeps it.
+    """
+    proc = process.spawn(cmd, env=env, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE,
+                         limits=limits)
+    proc.tripped = None
+    watchdog = process.Watchdog(proc, limits) if limits is not None and limits.watched() else None
+    if on_spawn is not None:
+        on_spawn(proc)
+    if job is not None and not job.attach(proc):
+        if watchdog is not None:
+            watchdog.stop()
+        return None
+    try:
+        archive.write(proc.stdin, files)
+        proc.stdin.close()
+    except (IOError, OSError):
+        # guru exited (or was killed) before reading the archive
+        pass
+
+    # stderr is drained on the side so neither pipe can fill up
+    errors = []
+    err_reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()))
+    err_reader.start()
+    out = read_text(proc.stdout, on_text, keep=keep)
+    err_reader.join()
+    if watchdog is not None:
+        watchdog.stop()
+    process.wait(proc)
+    if job is not None and job.cancelled:
+        return None
+    err = errors[0].decode('utf-8', 'replace') if errors else ''
+    proc.tripped = process.explain(proc, limits, watchdog, err)
+    if proc.tripped is not None:
+        err += "guru was stopped: %s\n" % proc.tripped
+    return out, err, proc.returncode
@@ -0,0 +1,362 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Structured guru results.
+
+With -json guru prints a sequence of JSON values (one per package for
+referrers). They are decoded one value at a time as the output arrives and
+flattened into compact records: a location, a kind and a description.
+"""
+
+import json
+import re
+from array import array
+
+
+# keys holding a "file:line:col" position in guru's JSON output
+POSITION_KEYS = ('pos', 'objpos', 'namepos', 'errpos')
+
+# keys describing the entity at a position, by preference
+DESCRIPTION_KEYS = ('desc', 'text', 'caller', 'name', 'type', 'kind')
+
+
+class Record(object):
+    """ One result location.
+    """
+
+    __slots__ = ('file', 'line', 'col', 'kind', 'desc')
+
+    def __init__(self, file, line, col, kind, desc):
+        self.file = file
+        self.line = line
+        self.col = col
+        self.kind = kind
+        self.desc = desc
+
+    def location(self):
+        return '%s:%d:%d' % (self.file, self.line, self.col)
+
+    def render(self):
+        if self.kind:
+            return '%s: %s: %s' % (self.location(), self.kind, self.desc)
+        return '%s: %s' % (self.location(), self.desc)
+
+    def to_list(self):
+        return [self.file, self.line, self.col, self.kind, self.desc]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+
+def parse_position(pos):
+    """ Splits "file:line:col" (or "file:line.col-line.col"), returns None
+    when 'pos' isn't a position.
+    """
+    parts = pos.rsplit(':', 2)
+    if len(parts) != 3:
+        return None
+    name, line, col = parts
+    if not line.isdigit():
+        # file:line.col-line.col
+        name, _, span = pos.rpartition(':')
+        if not name:
+            return None
+        line, _, col = span.partition('-')[0].partition('.')
+    try:
+        return name, int(line), int(col.split('-')[0])
+    except ValueError:
+        return None
+
+
+def extract(value, kind=''):
+    """ Yields a Record for every object of the decoded JSON 'value' that
+    holds a position, 'kind' being the key the object was found under.
+    """
+    if isinstance(value, list):
+        for item in value:
+            for record in extract(item, kind):
+                yield record
+        return
+    if not isinstance(value, dict):
+        return
+
+    for key in POSITION_KEYS:
+        pos = value.get(key)
+        if isinstance(pos, str):
+            location = parse_position(pos)
+            if location is not None:
+                desc = ''
+                for dkey in DESCRIPTION_KEYS:
+                    if isinstance(value.get(dkey), str):
+                        desc = value[dkey]
+                        break
+                yield Record(location[0], location[1], location[2], kind, desc)
+                break
+
+    for key, item in value.items():
+        if isinstance(item, (dict, list)):
+            for record in extract(item, key):
+                yield record
+
+
+# strings (complete, or just their opening quote when unterminated) and brackets
+_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]]')
+
+# the end of a string whose opening quote was in a previous piece
+_STRING_END = re.compile(r'(?:[^"\\]|\\.)*"')
+
+
+def _ends_in_escape(text):
+    return (len(text) - len(text.rstrip('\\'))) % 2 == 1
+
+
+class JsonStreamDecoder(object):
+    """ Decodes guru's JSON output fed in arbitrary pieces. Values are found
+    by tracking the bracket depth, every character is scanned once and only
+    the pieces of the value being received are kept in memory.
+    """
+
+    def __init__(self):
+        self.error = None
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """ Returns the records of the values completed by 'text'.
+        """
+        if self.error is not None or not text:
+            return []
+        records = []
+        pos = 0
+        start = 0
+
+        if self._in_string:
+            if self._escaped:
+                pos = 1
+                self._escaped = False
+            m = _STRING_END.match(text, pos)
+            if m is None:
+                self._escaped = _ends_in_escape(text[pos:])
+                self._parts.append(text)
+                return records
+            pos = m.end()
+            self._in_string = False
+
+        for m in _TOKENS.finditer(text, pos):
+            token = m.group()
+            if token == '"':
+                self._in_string = True
+                self._escaped = _ends_in_escape(text[m.end():])
+                break
+            if token in '{[':
+                self._depth += 1
+            elif token in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:m.end()])
+                    start = m.end()
+                    try:
+                        value = json.loads(''.join(self._parts))
+                    except ValueError as e:
+                        self.error = e
+                        return records
+                    finally:
+                        self._parts = []
+                    records.extend(extract(value))
+                elif self._depth < 0:
+                    self.error = ValueError('unbalanced %s' % token)
+                    return records
+
+        if self._depth or self._in_string:
+            self._parts.append(text[start:])
+        return records
+
+    def close(self):
+        """ Flags what is left as an error, the output ended mid value.
+        """
+        if (self._depth or self._in_string) and self.error is None:
+            self.error = ValueError('truncated JSON output')
+        return []
+
+
+def render(records):
+    """ Returns the condensed text of 'records', one line each.
+    """
+    if not records:
+        return ''
+    return '\n'.join(r.render() for r in records) + '\n'
+
+
+# "filename:line:col" pattern for json
+_JSON_LOCATION = re.compile(r'"([^"]+):([0-9]+):([0-9]+)"')
+# >filename:line:col< pattern for xml
+_XML_LOCATION = re.compile(r'>([^<]+):([0-9]+):([0-9]+)<')
+# filename:line.col-line.col: pattern for plain
+_PLAIN_LOCATION = re.compile(r'^(.+\.go):([0-9]+).([0-9]+)[-: ]')
+
+
+def find_location(line):
+    """ Returns the (file, line, col) a line of guru output points to, or None.
+    """
+    if '.go' not in line:
+        return None
+    m = _JSON_LOCATION.search(line) or _XML_LOCATION.search(line) or _PLAIN_LOCATION.search(line)
+    if m is None:
+        return None
+    return m.group(1), int(m.group(2)), int(m.group(3))
+
+
+class LocationTable(object):
+    """ Target location of every row of an output view, filled in as text is
+    written so a click is a dict lookup.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._expected = {}
+
+    def expect(self, records):
+        """ Registers the rendered lines of 'records' (json mode) with their
+        location, they are looked up instead of being parsed.
+        """
+        for record in records:
+            self._expected[record.render()] = (record.file, record.line, record.col)
+
+    def forget(self):
+        """ Drops the registered records, e.g. once a new query starts.
+        """
+        self._expected.clear()
+
+    def add(self, row, text):
+        """ Records the lines of 'text', which starts at the beginning of 'row'.
+        A trailing incomplete line is parsed again when it gets completed.
+        """
+        for i, line in enumerate(text.split('\n')):
+            location = self._expected.get(line)
+            if location is None:
+                location = find_location(line)
+            if location is None:
+                self._rows.pop(row + i, None)
+            else:
+                self._rows[row + i] = location
+
+    def get(self, row):
+        return self._rows.get(row)
+
+    def clear(self):
+        self._rows.clear()
+        self._expected.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class OutputPager(object):
+    """ Lets the first 'limit' lines of an output through and keeps the rest
+    (utf-8 encoded, with the line end offsets) to be shown on request.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.shown = 0
+        self._hidden = bytearray()
+        self._ends = array('q')
+        self._line = 0
+        self._pos = 0
+
+    def feed(self, text):
+        """ Returns the part of 'text' that fits under the limit.
+        """
+        if not self.limit:
+            return text
+        if self.shown >= self.limit or len(self._hidden):
+            self._store(text)
+            return ''
+
+        end = -1
+        for _ in range(self.limit - self.shown):
+            end = text.find('\n', end + 1)
+            if end == -1:
+                self.shown += text.count('\n')
+                return text
+        self.shown = self.limit
+        self._store(text[end + 1:])
+        return text[:end + 1]
+
+    def _store(self, text):
+        data = text.encode('utf-8')
+        base = len(self._hidden)
+        self._hidden.extend(data)
+        end = data.find(b'\n')
+        while end != -1:
+            self._ends.append(base + end + 1)
+            end = data.find(b'\n', end + 1)
+
+    def hidden(self):
+        """ Number of lines not shown yet.
+        """
+        lines = len(self._ends) - self._line
+        if len(self._hidden) > max(self._pos, self._ends[-1] if self._ends else 0):
+            lines += 1
+        return lines
+
+    def take(self, lines=None):
+        """ Returns the next 'lines' hidden lines (all of them when None).
+        """
+        if lines is None or self._line + lines >= len(self._ends):
+            end = len(self._hidden)
+            self._line = len(self._ends)
+        else:
+            self._line += lines
+            end = self._ends[self._line - 1]
+        text = bytes(self._hidden[self._pos:end]).decode('utf-8', 'replace')
+        self._pos = end
+        return text
+
+
+def merge_sections(sections):
+    """ Joins the outputs of queries run together into one report made of
+    (title, text) sections. Lines an earlier section already has are left
+    out and a section repeating an earlier one just refers to it.
+    """
+    seen = set()
+    first_title = {}
+    parts = []
+    for title, text in sections:
+        parts.append(title + '\n')
+        if text and text in first_title:
+            parts.append('same results as above\n\n')
+            continue
+        first_title[text] = title
+        lines = []
+        repeated = 0
+        for line in text.splitlines():
+            if line in seen:
+                repeated += 1
+                continue
+            seen.add(line)
+            lines.append(line + '\n')
+        parts.extend(lines)
+        if repeated:
+            parts.append('(%d more already listed above)\n' % repeated)
+        elif not lines:
+            parts.append('no results\n')
+        parts.append('\n')
+    return ''.join(parts)
+
+
+def unique_records(records):
+    """ Returns 'records' without repeated ones, in their order.
+    """
+    seen = set()
+    unique = []
+    for record in records:
+        key = tuple(record.to_list())
+        if key not in seen:
+            seen.add(key)
+            unique.append(record)
+    return unique
@@ -0,0 +1,170 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Query scheduler: a small pool of worker threads owned by GoGuru.
+
+- at most 'workers' queries (and so guru processes) run at once
+- queued queries are served by priority, then in submission order
+- a query identical to one already queued or running joins it (single-flight)
+- a new query in a group supersedes the older ones of that group, which are
+  dropped, or killed with their whole process tree when already running
+"""
+
+import heapq
+import itertools
+import threading
+import traceback
+
+from .process import kill_tree
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+
+class Job(object):
+    """ A scheduled query, 'fn(job)' is called on a worker thread and its
+    return value is handed to every waiting callback.
+    """
+
+    def __init__(self, key, fn, priority):
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.waiters = []  # (group, callback)
+        self.started = False
+        self.cancelled = False
+        self.proc = None
+        self._on_cancel = []
+        self._lock = threading.Lock()
+
+    def attach(self, proc):
+        """ Registers the process doing the job's work so cancel() can kill it.
+        Returns False (and kills it) when the job was already cancelled.
+        """
+        with self._lock:
+            self.proc = proc
+            cancelled = self.cancelled
+        if cancelled:
+            kill_tree(proc)
+        return not cancelled
+
+    def on_cancel(self, fn):
+        """ Calls 'fn()' when the job gets cancelled, right away if it is.
+        """
+        with self._lock:
+            if not self.cancelled:
+                self._on_cancel.append(fn)
+                return
+        fn()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            proc = self.proc
+            callbacks, self._on_cancel = self._on_cancel, []
+        if proc is not None:
+            kill_tree(proc)
+        for fn in callbacks:
+            fn()
+
+
+class Scheduler(object):
+
+    def __init__(self, workers=2):
+        self.workers = max(1, workers)
+        self._queue = []
+        self._jobs = {}  # key -> queued or running job
+        self._groups = {}  # group -> jobs
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def submit(self, key, fn, callback, priority=NORMAL, group=None, supersede=True, shared=True):
+        """ Schedules fn, 'callback(result)' is called on a worker thread
+        unless the query gets superseded. 'key' identifies identical queries
+        (None disables single-flight), 'group' the queries superseding each
+        other (None disables it), without 'supersede' the query joins the
+        group's queries instead (a batch of queries run together). Without
+        'shared' the query may join an identical one but later ones don't
+        join it (e.g. it streams its output to a single view).
+        """
+        with self._cond:
+            job = self._jobs.get(key) if key is not None else None
+            if job is not None and job.cancelled:
+                job = None
+            if group is not None and supersede:
+                self._supersede(group, keep=job)
+
+            if job is None:
+                job = Job(key, fn, priority)
+                if key is not None and shared:
+                    self._jobs[key] = job
+                heapq.heappush(self._queue, (priority, next(self._seq), job))
+                self._cond.notify()
+            elif priority < job.priority:
+                # identical query wanted sooner, queue it again with the new priority
+                job.priority = priority
+                heapq.heappush(self._queue, (priority, next(self._seq), job))
+                self._cond.notify()
+
+            job.waiters.append((group, callback))
+            if group is not None:
+                self._groups.setdefault(group, []).append(job)
+
+            if not self._threads:
+                for i in range(self.workers):
+                    t = threading.Thread(target=self._work, name='GoGuru-worker-%d' % i)
+                    t.daemon = True
+                    t.start()
+                    self._threads.append(t)
+        return job
+
+    def cancel_group(self, group):
+        with self._cond:
+            self._supersede(group)
+
+    def _supersede(self, group, keep=None):
+        for job in self._groups.pop(group, []):
+            job.waiters = [w for w in job.waiters if w[0] != group]
+            if job is keep:
+                continue
+            if not job.waiters and not job.cancelled:
+                job.cancel()
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._queue)
+                if job.cancelled or job.started:
+                    continue
+                job.started = True
+
+            result = None
+            try:
+                result = job.fn(job)
+            except Exception:
+                traceback.print_exc()
+
+            with self._cond:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                for group, _ in job.waiters:
+                    jobs = self._groups.get(group)
+                    if jobs and job in jobs:
+                        jobs.remove(job)
+                        if not jobs:
+                            del self._groups[group]
+                waiters = [] if job.cancelled else job.waiters
+
+            for _, callback in waiters:
+                try:
+                    callback(result)
+                except Exception:
+                    traceback.print_exc()
@@ -0,0 +1,31 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Immutable settings snapshot.
+"""
+
+from types import MappingProxyType
+
+
+class Settings(object):
+    """ The settings of a window at one point in time. Layers are given from
+    the highest priority (project) to the lowest (default settings).
+    """
+
+    __slots__ = ('_values',)
+
+    def __init__(self, *layers):
+        values = {}
+        for layer in reversed(layers):
+            values.update(layer)
+        self._values = MappingProxyType(values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __repr__(self):
+        return 'Settings(%r)' % dict(self._values)
@@ -0,0 +1,86 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Incremental reading of a process output and throttled delivery of it.
+"""
+
+import codecs
+import os
+import threading
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_text(stream, on_text=None, chunk_size=CHUNK_SIZE, keep=True):
+    """ Reads the binary 'stream' until EOF decoding it as utf-8 as it
+    arrives, 'on_text(text)' is called for every decoded piece.
+    Returns the whole text, or '' when 'keep' is False.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    fd = stream.fileno()
+    parts = []
+    while True:
+        data = os.read(fd, chunk_size)
+        text = decoder.decode(data, not data)
+        if text:
+            if keep:
+                parts.append(text)
+            if on_text is not None:
+                on_text(text)
+        if not data:
+            return ''.join(parts)
+
+
+class ThrottledWriter(object):
+    """ Collects text written from any thread and hands it to 'sink' in
+    batches, at most once every 'interval' ms. 'schedule(fn, delay_ms)'
+    decides where sink runs (e.g. sublime.set_timeout for the main thread).
+    """
+
+    def __init__(self, sink, schedule, interval=50):
+        self.sink = sink
+        self.schedule = schedule
+        self.interval = interval
+        self.written = False
+        self._parts = []
+        self._pending = False
+        self._discarded = False
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            if self._discarded:
+                return
+            self._parts.append(text)
+            self.written = True
+            if self._pending:
+                return
+            self._pending = True
+        self.schedule(self._flush, self.interval)
+
+    def close(self):
+        """ Delivers what is left as soon as possible.
+        """
+        with self._lock:
+            if not self._parts:
+                return
+            self._pending = True
+        self.schedule(self._flush, 0)
+
+    def discard(self):
+        """ Drops what wasn't delivered yet and everything written from now
+        on, e.g. once the output is superseded.
+        """
+        with self._lock:
+            self._discarded = True
+            self._parts = []
+
+    def _flush(self):
+        with self._lock:
+            text = ''.join(self._parts)
+            self._parts = []
+            self._pending = False
+        if text:
+            self.sink(text)
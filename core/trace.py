@@ -0,0 +1,184 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Query latency traces.
+
+A trace adds up the wall-clock time a query spends in named phases (settings,
+offsets, spawn, guru, decode, render...), possibly on several threads. When
+done it is appended as a JSON line to a size-rotated log, from which the
+latency percentiles per mode and phase are computed.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Trace(object):
+    """ Durations (seconds) of the phases of one query.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.phases = {}
+        self.info = {}
+        self.total = None
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    @contextmanager
+    def span(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    def finish(self):
+        """ Stops the clock, returns False when it was already stopped.
+        """
+        with self._lock:
+            if self.total is not None:
+                return False
+            self.total = time.perf_counter() - self.started
+            return True
+
+    def to_dict(self):
+        with self._lock:
+            record = {
+                'time': round(self.timestamp, 3),
+                'mode': self.mode,
+                'total_ms': round((self.total or 0) * 1000, 3),
+                'phases': dict((k, round(v * 1000, 3)) for k, v in self.phases.items()),
+            }
+        record.update(self.info)
+        return record
+
+    def summary(self):
+        """ One line breakdown, the longest phases first.
+        """
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda p: -p[1])
+        text = ', '.join('%s %s' % (name, format_ms(seconds * 1000)) for name, seconds in phases)
+        return 'GoGuru %s %s (%s)' % (self.mode, format_ms((self.total or 0) * 1000), text)
+
+
+@contextmanager
+def span(trace, phase):
+    """ trace.span(phase), nothing is measured when 'trace' is None.
+    """
+    if trace is None:
+        yield
+    else:
+        with trace.span(phase):
+            yield
+
+
+def format_ms(ms):
+    if ms >= 1000:
+        return '%.2fs' % (ms / 1000)
+    if ms >= 10:
+        return '%dms' % ms
+    return '%.1fms' % ms
+
+
+class TraceLog(object):
+    """ JSON lines log rotated at 'max_bytes', keeping 'backups' old files
+    (path.1 being the newest).
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                try:
+                    size = os.path.getsize(self.path)
+                except OSError:
+                    size = 0
+                if size and size + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a') as f:
+                    f.write(line)
+            except (OSError, IOError):
+                pass
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            source = self.path if i == 1 else '%s.%d' % (self.path, i - 1)
+            if os.path.exists(source):
+                os.replace(source, '%s.%d' % (self.path, i))
+        if not self.backups:
+            os.remove(self.path)
+
+    def read(self):
+        """ Returns the logged records, oldest first.
+        """
+        records = []
+        paths = ['%s.%d' % (self.path, i) for i in range(self.backups, 0, -1)] + [self.path]
+        with self._lock:
+            for path in paths:
+                try:
+                    with open(path) as f:
+                        for line in f:
+                            try:
+                                records.append(json.loads(line))
+                            except ValueError:
+                                pass
+                except (OSError, IOError):
+                    pass
+        return records
+
+    def clear(self):
+        with self._lock:
+            for path in [self.path] + ['%s.%d' % (self.path, i) for i in range(1, self.backups + 1)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def percentile(values, p):
+    """ Returns the p-th (0-100) percentile of the sorted 'values', nearest rank.
+    """
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+def format_stats(records):
+    """ Returns a table of the p50/p95/p99 latencies per mode and per phase.
+    """
+    by_mode = {}
+    for record in records:
+        mode = by_mode.setdefault(record.get('mode', '?'), {})
+        mode.setdefault('total', []).append(record.get('total_ms', 0))
+        for phase, ms in record.get('phases', {}).items():
+            mode.setdefault(phase, []).append(ms)
+
+    lines = ['%-24s %7s %10s %10s %10s' % ('mode / phase', 'count', 'p50', 'p95', 'p99')]
+    for mode in sorted(by_mode):
+        phases = by_mode[mode]
+        for phase in ['total'] + sorted(p for p in phases if p != 'total'):
+            values = sorted(phases[phase])
+            name = mode if phase == 'total' else '  ' + phase
+            lines.append('%-24s %7d %10s %10s %10s' % (
+                name, len(values), format_ms(percentile(values, 50)),
+                format_ms(percentile(values, 95)), format_ms(percentile(values, 99))))
+    return '\n'.join(lines) + '\n'
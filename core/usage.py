@@ -0,0 +1,61 @@
+# Copyright (c) 2016 Alvaro Leiva <https://github.com/alvarolm>
+# This program is Free Software see LICENSE file for details.
+
+"""
+Resource usage history of the guru processes.
+
+Every finished guru leaves a record (mode, scope, tags and what wait4
+reported: peak RSS, CPU time, page faults) in a JSON lines log (see
+trace.TraceLog), the report ranks the scope/mode combinations by how much
+memory and CPU they take.
+"""
+
+import time
+
+
+def make_record(mode, scope, tags, usage, seconds, returncode):
+    """ Returns the history record of one guru run, 'usage' being the
+    process.wait dict.
+    """
+    record = {
+        'time': round(time.time(), 3),
+        'mode': mode,
+        'scope': scope,
+        'scope_size': len([p for p in scope.split(',') if p]),
+        'tags': tags,
+        'seconds': round(seconds, 3),
+        'returncode': returncode,
+    }
+    record.update(usage)
+    return record
+
+
+def format_mb(kb):
+    return '%.1fMB' % (kb / 1024.0)
+
+
+def format_report(records, limit=20):
+    """ Returns the 'limit' most expensive scope/mode combinations, by peak
+    RSS then CPU time.
+    """
+    groups = {}
+    for record in records:
+        key = (record.get('scope', ''), record.get('mode', '?'), record.get('tags', ''))
+        group = groups.setdefault(key, {'runs': 0, 'max_rss_kb': 0, 'rss_kb': 0, 'cpu': 0, 'major_faults': 0,
+                                        'scope_size': record.get('scope_size', 0)})
+        group['runs'] += 1
+        group['max_rss_kb'] = max(group['max_rss_kb'], record.get('max_rss_kb', 0))
+        group['rss_kb'] += record.get('max_rss_kb', 0)
+        group['cpu'] += record.get('user_cpu', 0) + record.get('sys_cpu', 0)
+        group['major_faults'] += record.get('major_faults', 0)
+
+    ranked = sorted(groups.items(), key=lambda g: (-g[1]['max_rss_kb'], -g[1]['cpu']))[:limit]
+    lines = ['%-12s %5s %10s %10s %10s %10s %8s  %s' % (
+        'mode', 'runs', 'peak RSS', 'mean RSS', 'mean CPU', 'total CPU', 'majflt', 'scope (packages) tags')]
+    for (scope, mode, tags), group in ranked:
+        runs = group['runs']
+        lines.append('%-12s %5d %10s %10s %9.2fs %9.2fs %8d  %s (%d)%s' % (
+            mode, runs, format_mb(group['max_rss_kb']), format_mb(group['rss_kb'] / runs),
+            group['cpu'] / runs, group['cpu'], group['major_faults'], scope or '-', group['scope_size'],
+            ' ' + tags if tags else ''))
+    return '\n'.join(lines) + '\n'
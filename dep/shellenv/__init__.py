@@ -11,13 +11,23 @@ from ._encoding import env_encode, env_decode, path_encode, path_decode  # noqa
 if sys.platform == 'win32':
     from ._win import get_env, get_user_login_shell
 
+    def set_cache_path(path, ttl=None):
+        """
+        The env isn't fetched from a shell on Windows, there is nothing to persist
+        """
+
+    def clear_cache():
+        pass
+
 elif sys.platform == 'darwin':
     from ._osx import get_env
     from ._osx.open_directory import get_user_login_shell
+    from ._posix import set_cache_path, clear_cache  # noqa
 
 else:
     from ._linux import get_env
     from ._linux.getent import get_user_login_shell  # noqa
+    from ._posix import set_cache_path, clear_cache  # noqa
 
 
 __version__ = '1.4.2'
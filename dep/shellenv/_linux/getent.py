@@ -1,6 +1,7 @@
 # coding: utf-8
 from __future__ import unicode_literals, division, absolute_import, print_function
 
+import pwd
 import subprocess
 from getpass import getuser
 
@@ -12,7 +13,8 @@ _login_shells = {}
 
 def get_user_login_shell(username=None):
     """
-    Uses getent to get the user's login shell
+    Reads the user's login shell from the passwd database (in-process, through
+    NSS like getent does), only falling back to running getent when that fails
 
     :param username:
         A unicode string of the user to get the shell for - None for the
@@ -32,18 +34,17 @@ def get_user_login_shell(username=None):
 
     if username not in _login_shells:
 
-        proc = subprocess.Popen(['getent', 'passwd', username], stdout=subprocess.PIPE)
-
-        out = b''
-        while proc.poll() is None:
-            out += proc.stdout.read()
-        out += proc.stdout.read()
-
-        proc.stdout.close()
-
-        line = out.decode('utf-8').strip()
-        parts = line.split(':', 6)
-        login_shell = parts[6]
+        try:
+            login_shell = pwd.getpwnam(username).pw_shell
+            if not isinstance(login_shell, str_cls):
+                login_shell = login_shell.decode('utf-8')
+        except KeyError:
+            proc = subprocess.Popen(['getent', 'passwd', username], stdout=subprocess.PIPE)
+            out, _ = proc.communicate()
+
+            line = out.decode('utf-8').strip()
+            parts = line.split(':', 6)
+            login_shell = parts[6]
 
         _login_shells[username] = login_shell
 
@@ -4,7 +4,10 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 import re
 import os
 import sys
+import json
+import time
 import subprocess
+import threading
 
 from ._types import str_cls, type_name
 
@@ -16,6 +19,100 @@ else:
 
 _envs = {'bytes': {}, 'unicode': {}}
 
+# only one shell is spawned at a time, concurrent callers wait for its result
+_lock = threading.Lock()
+
+_cache = {'path': None, 'ttl': 24 * 60 * 60}
+
+# files whose modification invalidates a persisted env
+_rc_files = [
+    '~/.profile', '~/.bash_profile', '~/.bash_login', '~/.bashrc',
+    '~/.zshenv', '~/.zprofile', '~/.zshrc', '~/.zlogin',
+    '~/.config/fish/config.fish',
+    '/etc/profile', '/etc/profile.d', '/etc/bash.bashrc', '/etc/bashrc',
+    '/etc/zshenv', '/etc/zprofile', '/etc/zshrc', '/etc/environment',
+]
+
+
+def set_cache_path(path, ttl=None):
+    """
+    Enables persisting the shell envs to disk, so they survive restarts. A
+    persisted env is discarded when one of the shell startup files changes or
+    when it is older than ttl.
+
+    :param path:
+        A unicode string of the json file to persist to, None to disable
+
+    :param ttl:
+        The number of seconds a persisted env is valid, None keeps the current
+    """
+
+    _cache['path'] = path
+    if ttl is not None:
+        _cache['ttl'] = ttl
+
+
+def clear_cache():
+    """
+    Forgets the envs fetched so far, in memory and on disk
+    """
+
+    with _lock:
+        _envs['bytes'].clear()
+        _envs['unicode'].clear()
+        if _cache['path'] and os.path.exists(_cache['path']):
+            os.remove(_cache['path'])
+
+
+def _fingerprint(shell):
+    stamps = [shell]
+    for rc in _rc_files:
+        path = os.path.expanduser(rc)
+        try:
+            stamps.append([path, os.stat(path).st_mtime])
+        except OSError:
+            pass
+    return stamps
+
+
+def _load_persisted(shell):
+    if not _cache['path']:
+        return None
+    try:
+        with open(_cache['path'], 'r') as f:
+            entry = json.load(f).get(shell)
+    except (IOError, OSError, ValueError):
+        return None
+    if not entry or entry.get('fingerprint') != _fingerprint(shell):
+        return None
+    if time.time() - entry.get('time', 0) > _cache['ttl']:
+        return None
+    return entry.get('env')
+
+
+def _persist(shell, env):
+    path = _cache['path']
+    if not path:
+        return
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        data = {}
+    data[shell] = {'fingerprint': _fingerprint(shell), 'time': time.time(), 'env': env}
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp = path + '.tmp'
+        # the login environment may hold credentials, only the user reads it
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
+
 
 def get_shell_env(shell=None, for_subprocess=False):
     """
@@ -45,38 +142,52 @@ def get_shell_env(shell=None, for_subprocess=False):
 
     output_type = 'bytes' if sys.version_info < (3,) and for_subprocess else 'unicode'
 
-    if shell not in _envs[output_type]:
-        args = [shell, '-l']
-        # For bash we invoke interactively or else ~/.bashrc is not
-        # loaded, and many distros and users use .bashrc for env vars
-        if shell_name == 'bash':
-            args.append('-i')
-        env_proc = subprocess.Popen(
-            args,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT
-        )
-
-        stdout, _ = env_proc.communicate(b'/usr/bin/env\n')
-
-        _envs[output_type][shell] = {}
-
-        entries = re.split(b'\n(?=\\w+=)', stdout.strip())
-        for entry in entries:
-            if entry == b'':
-                continue
-            parts = entry.split(b'=', 1)
-            if len(parts) < 2:
-                continue
-            name = parts[0]
-            value = parts[1]
-            if output_type == 'unicode':
-                name = name.decode('utf-8', 'replace')
-                value = value.decode('utf-8', 'replace')
-            _envs[output_type][shell][name] = value
+    with _lock:
+        if shell not in _envs[output_type]:
+            _fetch_env(shell, shell_name, output_type)
 
     if output_type == 'bytes':
         shell = shell.encode('utf-8')
 
     return (shell, _envs[output_type][shell].copy())
+
+
+def _fetch_env(shell, shell_name, output_type):
+    if output_type == 'unicode':
+        persisted = _load_persisted(shell)
+        if persisted is not None:
+            _envs[output_type][shell] = persisted
+            return
+
+    args = [shell, '-l']
+    # For bash we invoke interactively or else ~/.bashrc is not
+    # loaded, and many distros and users use .bashrc for env vars
+    if shell_name == 'bash':
+        args.append('-i')
+    env_proc = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+
+    stdout, _ = env_proc.communicate(b'/usr/bin/env\n')
+
+    _envs[output_type][shell] = {}
+
+    entries = re.split(b'\n(?=\\w+=)', stdout.strip())
+    for entry in entries:
+        if entry == b'':
+            continue
+        parts = entry.split(b'=', 1)
+        if len(parts) < 2:
+            continue
+        name = parts[0]
+        value = parts[1]
+        if output_type == 'unicode':
+            name = name.decode('utf-8', 'replace')
+            value = value.decode('utf-8', 'replace')
+        _envs[output_type][shell][name] = value
+
+    if output_type == 'unicode':
+        _persist(shell, _envs[output_type][shell])
@@ -11,12 +11,25 @@ go get golang.org/x/tools/cmd/guru
 # TODO: review & clean
 
 
+import time
+import_started = time.perf_counter()
+
 import sublime
 import sublime_plugin
-import re
 import os
 import subprocess
 import sys
+import threading
+from collections import OrderedDict
+
+from .core import archive, godoc, lsp, packages, process, query, scheduler, trace, usage
+from .core.cache import ResultCache, make_key
+from .core.offsets import LineIndex
+from .core.prefetch import PrefetchStore
+from .core.results import JsonStreamDecoder, LocationTable, OutputPager, Record, merge_sections, unique_records
+from .core.results import render as render_records
+from .core.settings import Settings
+from .core.stream import ThrottledWriter
 
 
 def log(*msg):
@@ -24,7 +37,7 @@ def log(*msg):
 
 
 def debug(*msg):
-    if get_setting("goguru_debug", False):
+    if debug_enabled:
         print("GoGuru [DEBUG]:", msg[0:])
 
 
@@ -33,10 +46,22 @@ def error(*msg):
 
 
 def plugin_loaded():
+    """ Only in-memory work happens here, everything else is deferred to
+    a background thread (see deferred_startup).
+    """
+    started = time.perf_counter()
+
+    # settings snapshots are rebuilt only after a change
+    sublime.load_settings("GoGuru.sublime-settings").add_on_change("goguru", invalidate_settings)
+    sublime.load_settings("Default.sublime-settings").add_on_change("goguru", invalidate_settings)
+
     # load shellenv
     def load_shellenv():
         global shellenv
         from .dep import shellenv
+        shellenv.set_cache_path(os.path.join(sublime.cache_path(), "GoGuru", "shellenv.json"))
+
+    package_graphs.directory = os.path.join(sublime.cache_path(), "GoGuru", "packages")
 
     # try golangconfig
     if get_setting("goguru_use_golangconfig", False):
@@ -52,37 +77,67 @@ def plugin_loaded():
     else:
         load_shellenv()
 
-    log("debug:", get_setting("goguru_debug", False))
-    log("use_golangconfig", get_setting("goguru_use_golangconfig", False))
+    loaded_seconds = time.perf_counter() - started
+    t = threading.Thread(target=lambda: deferred_startup(loaded_seconds), name="GoGuru-startup")
+    t.daemon = True
+    t.start()
 
-    # keep track of the version if possible (pretty nasty workaround, any other ideas ?)
-    try:
-        PluginPath = os.path.dirname(os.path.realpath(__file__))
-        p = subprocess.Popen(["git", "describe", "master", "--tags"], stdout=subprocess.PIPE, cwd=PluginPath)
-        GITVERSION = p.communicate()[0].decode("utf-8").rstrip()
-        if p.returncode != 0:
-            debug("git return code", p.returncode)
-            raise Exception("git return code", p.returncode)
-
-        defsettings = os.path.join(PluginPath, 'Default.sublime-settings')
-        f = open(defsettings, 'r')
-        filedata = f.read()
-        f.close()
-        newdata = filedata.replace(get_setting('goguru_version'), GITVERSION + '_')
-        f = open(defsettings, 'w')
-        f.write(newdata)
-        f.close()
-    except:
-        debug("couldn't get git tag:", sys.exc_info()[0])
-
-    # read version
-    log("version:", get_setting('goguru_version'))
+
+def deferred_startup(loaded_seconds):
+    """ Startup work that isn't needed before the first query.
+    """
+    settings = get_settings(sublime.active_window())
+    log("debug:", settings.get("goguru_debug", False))
+    log("use_golangconfig", settings.get("goguru_use_golangconfig", False))
+    log("startup: import %.1f ms, plugin_loaded %.1f ms" % (import_seconds * 1000, loaded_seconds * 1000))
+
+    # the login shell env is persisted and captured now,
+    # so the first query doesn't pay for starting the shell
+    if "shellenv" in globals():
+        started = time.perf_counter()
+        shellenv.get_env(for_subprocess=True)
+        debug("shellenv warm up %.1f ms" % ((time.perf_counter() - started) * 1000))
+
+    log("version:", get_version(settings))
 
     # check if user setting exists and creates it
-    us = sublime.load_settings("GoGuru.sublime-settings")
-    if (not us.has('goguru_debug')):
-        us.set('goguru_debug', get_setting("goguru_debug", False))
-        sublime.save_settings("GoGuru.sublime-settings")
+    def create_user_settings():
+        us = sublime.load_settings("GoGuru.sublime-settings")
+        if (not us.has('goguru_debug')):
+            us.set('goguru_debug', settings.get("goguru_debug", False))
+            sublime.save_settings("GoGuru.sublime-settings")
+    sublime.set_timeout(create_user_settings, 0)
+
+
+def get_version(settings):
+    """ Returns the package version, described by git when GoGuru is
+    installed from a git checkout.
+    """
+    version = settings.get("goguru_version")
+    path = os.path.dirname(os.path.realpath(__file__))
+    if not os.path.exists(os.path.join(path, ".git")):
+        return version
+    try:
+        described = subprocess.check_output(["git", "describe", "--tags"], cwd=path, stderr=subprocess.DEVNULL)
+        return "%s (%s)" % (version, described.decode("utf-8").strip())
+    except (OSError, subprocess.CalledProcessError):
+        debug("couldn't get git tag:", sys.exc_info()[1])
+        return version
+
+
+def plugin_unloaded():
+    sublime.load_settings("GoGuru.sublime-settings").clear_on_change("goguru")
+    sublime.load_settings("Default.sublime-settings").clear_on_change("goguru")
+    for client in list(lsp_clients.values()):
+        client.shutdown()
+    lsp_clients.clear()
+
+
+# modes the user is typically waiting on, served before the others
+INTERACTIVE_MODES = ("definition", "describe", "what")
+
+# modes that can be prefetched while the cursor rests on an identifier
+PREFETCH_MODES = ("definition", "describe")
 
 
 class GoGuruCommand(sublime_plugin.TextCommand):
@@ -92,24 +147,38 @@ class GoGuruCommand(sublime_plugin.TextCommand):
         self.mode = 'None'
         self.env = 'None'
         self.local_package = 'None'
+        self.prepared = None
+        self.trace = None
+        self.snapshots = None
 
     def run(self, edit, mode=None, output=True):
         """
         :param output: won't show the show_panel if set to False. It is particularly useful for mouse clicks.
         """
         self.output = output
-        try:
-            region = self.view.sel()[0]
-            text = self.view.substr(sublime.Region(0, region.end()))
-            cb_map = self.get_map(text)
-            byte_end = cb_map[sorted(cb_map.keys())[-1]]
-            byte_begin = None
-            if not region.empty():
-                byte_begin = cb_map[region.begin() - 1]
-        except:
-            sublime.error_message('GoGuru:\nCouldn\'t get cursor positon, make sure that the Go source file is saved and the cursor is over the identifier (variable, function ...) you want to query.')
-            error("couldn't get cursor positon: ", sys.exc_info())
+        self.prepared = None
+        # the buffers are read (and encoded) once per query
+        self.snapshots = {}
+        self.trace = trace.Trace(mode) if mode else None
+        # one settings snapshot for the whole query
+        with trace.span(self.trace, "settings"):
+            self.settings = get_settings(self.view.window())
+        with trace.span(self.trace, "offsets"):
+            positions = self.cursor_positions()
+        if positions is None:
             return
+        region = positions[0][0]
+
+        # answered already by the prefetcher (which only queries the cursor)
+        if mode in PREFETCH_MODES and len(positions) == 1 and region.empty():
+            key = prefetch_key(self.view, region.end())
+            prefetched = prefetch_store.get(key + (mode,)) if key is not None else None
+            if prefetched is not None:
+                debug("prefetched", mode, key)
+                self.trace.info["prefetched"] = True
+                self.write_running(mode)
+                self.write_out(prefetched[0], prefetched[1], False, prefetched[2])
+                return
 
         if mode:
             self.write_running(mode)
@@ -132,7 +201,9 @@ class GoGuruCommand(sublime_plugin.TextCommand):
                     self.write_out(None, "'searching documentation with 'goguru mode=godoc_direct'...")
                 sublime.set_timeout(lambda: messageLookingDoc(), 150)  # any other choice besides timeout ?
                 mode = "describe"
-            self.guru(byte_end, begin_offset=byte_begin, mode=mode, callback=self.guru_complete)
+            self.query(positions, mode)
+            if self.mode in ("godoc", "godoc_direct") and self.settings.get("goguru_godoc_prefetch", True) and self.env != 'None':
+                self.prefetch_docs()
             return
 
         # Get the guru mode from the user.
@@ -156,12 +227,104 @@ class GoGuruCommand(sublime_plugin.TextCommand):
             if i >= 0:
                 self.write_running(modes[i])
 
-                self.guru(byte_end, begin_offset=byte_begin, mode=modes[i], callback=self.guru_complete)
+                self.query(positions, modes[i])
 
         self.view.window().show_quick_panel(descriptions, on_done, sublime.MONOSPACE_FONT)
 
-    def guru_complete(self, out, err):
-        self.write_out(out, err)
+    def cursor_positions(self):
+        """ Returns the (region, byte end, byte begin) of every cursor, None
+        (after telling the user) when they can't be computed.
+        """
+        try:
+            positions = []
+            for region in self.view.sel():
+                if region.end() == 0:
+                    raise ValueError("cursor at the beginning of the file")
+                byte_begin = None
+                if not region.empty():
+                    byte_begin = byte_offset(self.view, region.begin() - 1, self.snapshots)
+                positions.append((region, byte_offset(self.view, region.end() - 1, self.snapshots), byte_begin))
+            if not positions:
+                raise ValueError("no cursor")
+            return positions
+        except:
+            sublime.error_message('GoGuru:\nCouldn\'t get cursor positon, make sure that the Go source file is saved and the cursor is over the identifier (variable, function ...) you want to query.')
+            error("couldn't get cursor positon: ", sys.exc_info())
+            return None
+
+    def guru_complete(self, out, err, streamed=False, records=None):
+        self.write_out(out, err, streamed, records)
+
+    def query(self, positions, mode):
+        """ Runs mode at the cursors, see guru_cursors. Documentation is only
+        looked up for the first one.
+        """
+        if len(positions) > 1 and self.mode not in ("godoc", "godoc_direct"):
+            self.guru_cursors(positions, mode)
+            return
+        _, byte_end, byte_begin = positions[0]
+        self.guru(byte_end, begin_offset=byte_begin, mode=mode, callback=self.guru_complete)
+
+    def guru_cursors(self, positions, mode):
+        """ Runs mode at every cursor at once, the scheduler bounds how many
+        guru run in parallel, and writes a single report grouped by cursor
+        once all of them finished. Cursors on the same position share a run.
+        """
+        if not self.prepare(self.guru_complete):
+            return
+        cursors = OrderedDict()  # (byte end, byte begin) -> cursor numbers
+        regions = {}
+        for i, (region, byte_end, byte_begin) in enumerate(positions):
+            cursors.setdefault((byte_end, byte_begin), []).append(i + 1)
+            regions.setdefault((byte_end, byte_begin), region)
+
+        file_path = self.view.file_name()
+        titles = []
+        for position, numbers in cursors.items():
+            region = regions[position]
+            row, col = self.view.rowcol(region.begin())
+            text = self.view.substr(region if not region.empty() else self.view.word(region.end() - 1))
+            titles.append("%s:%d:%d: cursor %s %s" % (
+                file_path, row + 1, col + 1, ", ".join(str(n) for n in numbers), " ".join(text.split())[:40]))
+        results = [None] * len(titles)
+
+        def complete(i, out, err, streamed=False, records=None):
+            results[i] = (out or "", err or "", records)
+            if any(r is None for r in results):
+                return
+            report = merge_sections((titles[j], r[0]) for j, r in enumerate(results))
+            err = "".join("%s\n%s" % (titles[j], r[1]) for j, r in enumerate(results) if r[1])
+            records = None
+            if any(r[2] is not None for r in results):
+                records = last_records[self.view.window().id()] = unique_records(rec for r in results for rec in (r[2] or []))
+            self.show_result(report, err, jump=False, records=records)
+
+        for i, position in enumerate(cursors):
+            self.guru(position[0], begin_offset=position[1], mode=mode, callback=lambda *a, i=i: complete(i, *a),
+                      streaming=False, supersede=i == 0, point=regions[position].end())
+
+    def prefetch(self, modes):
+        """ Runs 'modes' at the cursor in the background, their results are
+        kept in prefetch_store for run to answer from.
+        """
+        self.output = False
+        self.trace = None
+        self.snapshots = {}
+        self.settings = get_settings(self.view.window())
+        point = self.view.sel()[0].end()
+        key = prefetch_key(self.view, point)
+        if key is None:
+            return
+        byte_end = byte_offset(self.view, point - 1, self.snapshots)
+        for mode in modes:
+            if mode not in PREFETCH_MODES or prefetch_store.get(key + (mode,)) is not None:
+                continue
+
+            def store(out, err, streamed=False, records=None, mode=mode):
+                if out:
+                    prefetch_store.put(key + (mode,), (out, err, records))
+            self.guru(byte_end, mode=mode, callback=store, priority=scheduler.BACKGROUND,
+                      group=prefetch_group(self.view.window(), mode))
 
     def write_running(self, mode):
         """ Write the "Running..." header to a new file and focus it to get results
@@ -170,24 +333,30 @@ class GoGuruCommand(sublime_plugin.TextCommand):
         self.mode = mode
 
         window = self.view.window()
-        view = get_output_view(window)
+        view = get_output_view(window, self.settings)
+
+        # huge results only render the first lines, the rest is paged in on request
+        limits = self.settings.get("goguru_max_lines", {})
+        limit = limits.get(mode, limits.get("*", 0))
 
         # Run a new command to use the edit object for this view.
-        view.run_command('go_guru_write_running', {'mode': mode})
-        if get_setting("goguru_output", "buffer") == "output_panel" and self.output:
+        view.run_command('go_guru_write_running', {'mode': mode, 'limit': limit})
+        if self.settings.get("goguru_output", "buffer") == "output_panel" and self.output:
             window.run_command('show_panel', {'panel': "output." + view.name(), 'toggle': False})
         else:
             window.focus_view(view)
 
-    def write_out(self, result, err):
+    def write_out(self, result, err, streamed=False, records=None):
         """ Write the guru output to a new file.
+        'streamed' tells the result was already appended while guru ran,
+        'records' are the decoded results in json mode.
         """
 
         def cleanPackageAddr(p):
             return str(p).replace('"', '').replace('(', '').replace(')', '').replace('*', '')
 
-        window = self.view.window()
-        view = get_output_view(window)
+        if records is not None:
+            last_records[self.view.window().id()] = records
 
         # parse guru describe to query go doc
         jump = False
@@ -258,37 +427,85 @@ class GoGuruCommand(sublime_plugin.TextCommand):
                 jump = True
 
             if not jump:
-                cmd = "go doc %(package)s %(identifier)s " % {
-                    "package": package,
-                    "identifier": identifier,
-                }
-                debug("godoc", "cmd", cmd)
-
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, env=self.env)
-                o, e = proc.communicate()
-
-                result = o.decode('utf-8')
-
-                # comment non go code
-                prettierResult = ''
-                for line in result.splitlines():
-                    if line[0:4] == '    ':
-                        prettierResult += '//' + line + '\n'
-                    else:
-                        prettierResult += line + '\n'
-                result = '\n'.join(prettierResult, definitionLine)
-                err = e.decode('utf-8')
+                self.lookup_doc(package.split() + [identifier], definitionLine)
+                return
 
-        # Run a new command to use the edit object for this view.
-        view.run_command('go_guru_write_results', {
-            'result': result,
-            'err': err})
+        self.show_result(result, err, streamed, records=records)
 
-        if get_setting("goguru_output", "buffer") == "output_panel" and self.output:
-            window.run_command('show_panel', {'panel': "output." + view.name()})
-        else:
-            window.focus_view(view)
+    def lookup_doc(self, args, definition_line, priority=scheduler.INTERACTIVE):
+        """ Runs 'go doc args' on a worker (or takes it from the doc cache) and
+        shows it followed by the definition line, nothing is shown when
+        'definition_line' is None (prefetch).
+        """
+        args = [a for a in args if a]
+        env = self.env
+        settings = self.settings
+        go = process.resolve("go", env) or "go"
+        cwd = os.path.dirname(self.view.file_name())
+        module_root = packages.module_root(cwd)
+        debug("godoc", "args", args)
+        query_trace = self.trace if definition_line is not None else None
+
+        def work(job):
+            # without a package go doc resolves the identifier in cwd
+            key = (tuple(args), cwd, module_root, godoc.fingerprint(go, env, module_root))
+            doc = doc_cache.get(key)
+            if doc is None:
+                # inside the package directory go doc doesn't have to search for it
+                doc_args, doc_cwd = args, cwd
+                package = [a for a in args if not a.startswith("-")][:1]
+                if package and packages.is_module(module_root):
+                    directory = get_package_graph(module_root, env, settings).dir_for_package(package[0])
+                    if directory is not None:
+                        doc_args = [a for a in args if a != package[0]]
+                        doc_cwd = directory
+                with trace.span(query_trace, "godoc"):
+                    doc = godoc.run(go, env, doc_args, cwd=doc_cwd, job=job)
+                if doc is None:
+                    return None
+                if doc[2] == 0:
+                    doc_cache.put(key, doc)
+            else:
+                debug("godoc cache hit", args)
+            return doc
+
+        def done(doc):
+            if doc is None or definition_line is None:
+                return
+            out, err, _ = doc
+            sublime.set_timeout(lambda: self.show_result(godoc.format_doc(out, definition_line), err), 0)
+
+        get_scheduler(self.settings).submit(("godoc", tuple(args), cwd, module_root), work, done, priority=priority)
+
+    def prefetch_docs(self):
+        """ Looks up, in the background, the documentation of the packages
+        imported by the current file.
+        """
+        head = self.view.substr(sublime.Region(0, min(self.view.size(), 64 * 1024)))
+        for package in godoc.parse_imports(head):
+            self.lookup_doc([package], None, priority=scheduler.BACKGROUND)
+
+    def show_result(self, result, err, streamed=False, jump=True, records=None):
+        """ Writes a result to the output view, jumping to it when needed
+        (and 'jump' allows it). 'records' are the ones rendered in 'result'.
+        """
+        window = self.view.window()
+        with trace.span(self.trace, "render"):
+            view = get_output_view(window, self.settings)
+
+            # Run a new command to use the edit object for this view.
+            view.run_command('go_guru_write_results', {
+                'result': result,
+                'err': err,
+                'streamed': streamed,
+                'records': record_lists(records)})
+
+            show_output(window, view, self.settings, panel=self.output)
+        if result is not None:
+            finish_trace(self.view, self.trace, self.settings)
 
+        if not jump:
+            return
         # the case when clicking doesn't require showing the output
         if self.mode == 'definition' and not self.output:
             if result:
@@ -299,7 +516,7 @@ class GoGuruCommand(sublime_plugin.TextCommand):
                     window.focus_group(group)
         # jump to definition if is set
         elif self.mode == 'definition':
-            if get_setting("goguru_jumpto_definition", False):
+            if self.settings.get("goguru_jumpto_definition", False):
                 if result:
                     coordinates = result.split(':')[:3]
                     new_view = window.open_file(':'.join(coordinates), sublime.ENCODED_POSITION)
@@ -307,143 +524,465 @@ class GoGuruCommand(sublime_plugin.TextCommand):
                     if group != -1:
                         window.focus_group(group)
 
-    def get_map(self, chars):
-        """ Generate a map of character offset to byte offset for the given string 'chars'.
+    def prepare(self, callback):
+        """ Resolves what the queries of a command share: the environment,
+        guru, the scope settings and the unsaved buffers of the window.
+        Returns False (after reporting it to 'callback' when possible) if
+        guru can't be run.
+        """
+        self.prepared = None
+        with trace.span(self.trace, "env"):
+            # golang config or shellenv ?
+            cmd_env = ''
+            if self.settings.get("goguru_use_golangconfig", False):
+                try:
+                    toolpath, cmd_env = golangconfig.subprocess_info('guru', ['GOPATH', 'PATH'], view=self.view)
+                    toolpath = os.path.realpath(toolpath)
+                except:
+                    error("golangconfig:", sys.exc_info())
+                    return False
+            else:
+                toolpath = None
+                cmd_env = shellenv.get_env(for_subprocess=True)[1]
+                debug("cmd_env", cmd_env)
+                goguru_env = self.settings.get("goguru_env", {})
+                debug("goguru_env", goguru_env)
+                cmd_env.update(goguru_env)
+
+            debug("final_env", cmd_env)
+            self.env = cmd_env
+
+            if toolpath is None:
+                toolpath = process.resolve('guru', cmd_env)
+        if toolpath is None:
+            error("couldn't find guru in PATH", cmd_env.get("PATH"))
+            callback(None, "couldn't find guru in PATH, see the Dependencies section of the README\n")
+            return False
+
+        # unsaved Go buffers of the window, guru reads the rest from disk
+        with trace.span(self.trace, "modified"):
+            modified = get_modified_files(self.view.window(), self.snapshots)
+        # from now on the bundle holds them
+        self.snapshots = None
+        debug("modified", [m.name for m in modified])
+
+        self.prepared = {
+            "env": cmd_env,
+            "toolpath": toolpath,
+            "file_path": self.view.file_name(),
+            # the local package is resolved on the worker, see scope
+            "scope": self.settings.get("goguru_scope", []),
+            "use_current_package": self.settings.get("goguru_use_current_package", True),
+            "tags": " ".join(self.settings.get("goguru_tags", [])),
+            "json": self.settings.get("goguru_json", False),
+            "modified": modified,
+            "bundle": archive.Bundle(modified),
+            "env_key": make_key(sorted(cmd_env.items())),
+            "scopes": {},
+            "lock": threading.Lock(),
+        }
+        debug("goguru_use_current_package", self.prepared["use_current_package"])
+        return True
+
+    def scope(self, prepared, settings, auto_scope, local):
+        """ Returns the -scope of the 'prepared' queries (computed once, on a
+        worker), 'auto_scope' replacing it with the packages importing the
+        current one. The current package is only looked up when 'local' is
+        set (the modes using -scope, and godoc), in a module that may take
+        a go list of the whole module. It is kept as prepared["local_package"].
+        """
+        with prepared["lock"]:
+            scope = prepared["scopes"].get((auto_scope, local))
+            if scope is not None:
+                return scope
+            file_path = prepared["file_path"]
+            scope = list(prepared["scope"])
+            if prepared["use_current_package"] and local:
+                local_package = resolve_package(file_path, prepared["env"], settings)
+                debug("local_package", local_package)
+                prepared["local_package"] = local_package
+                scope.append(local_package)
+            if auto_scope:
+                scope = get_auto_scope(file_path, prepared["env"], settings) or scope
+            scope = ",".join(p.strip() for p in scope if p.strip())
+            debug("guru_scope", scope)
+            prepared["scopes"][(auto_scope, local)] = scope
+            return scope
+
+    def guru(self, end_offset, begin_offset=None, mode="describe", callback=None, priority=None, group=None,
+             streaming=True, supersede=True, point=None):
+        """ Builds the guru shell command and calls it, returning it's output as a string.
+        By default the query supersedes the window's previous one, and its
+        prefetches, and has the priority of its mode. Queries made after one
+        prepare call share its environment, scope and archive. 'point' is
+        the cursor (the first one by default), used by gopls.
         """
 
-        byte_offset = 0
-        cb_map = {}
-
-        for char_offset, char in enumerate(chars):
-            cb_map[char_offset] = byte_offset
-            byte_offset += len(char.encode('utf-8'))
-            if char == '\n' and self.view.line_endings() == "Windows":
-                byte_offset += 1
-        return cb_map
+        if self.prepared is None and not self.prepare(callback):
+            return
+        # the workers only use what this query was submitted with, the next
+        # query on the view replaces these attributes
+        prepared = self.prepared
+        settings = self.settings
+        query_trace = self.trace
+        cmd_env = prepared["env"]
+        file_path = prepared["file_path"]
+        modified = prepared["modified"]
+        guru_tags = prepared["tags"]
+        guru_json = prepared["json"]
+
+        # Build guru cmd, the scope is added on the worker.
+        # modified update 22/10/2019 - 3 (DD/MM/YYYY)
+        pos = query.position(file_path, end_offset, begin_offset)
+        cmd = query.command(prepared["toolpath"], mode, pos, tags=guru_tags, json_output=guru_json, modified=bool(modified))
+        debug("cmd", cmd)
 
-    def guru(self, end_offset, begin_offset=None, mode="describe", callback=None):
-        """ Builds the guru shell command and calls it, returning it's output as a string.
+        # everything but the buffer contents, which are hashed off the main thread
+        cache_parts = None
+        if self.settings.get("goguru_cache", True):
+            cache_parts = [mode, pos, guru_tags, guru_json, prepared["env_key"]]
+            if not self.view.is_dirty():
+                try:
+                    st = os.stat(file_path)
+                    cache_parts.append([st.st_mtime, st.st_size])
+                except OSError:
+                    pass
+        persist = not modified
+        limits = process.Limits.for_mode(self.settings.get("goguru_limits", {}), mode)
+
+        # results are shown as guru prints them, unless they must be parsed first
+        stream = None
+        pending_records = []
+        if streaming and self.output and self.mode not in ("godoc", "godoc_direct") and self.settings.get("goguru_stream_output", True):
+            output_view = get_output_view(self.view.window(), self.settings)
+            started = []
+
+            def append(text):
+                if not started:
+                    started.append(True)
+                    text = "\n" + text
+                # decoded before their text was written, so they cover 'text'
+                records = pending_records[:]
+                del pending_records[:len(records)]
+                with trace.span(query_trace, "render"):
+                    output_view.run_command('go_guru_append_results', {'text': text, 'records': record_lists(records)})
+            stream = ThrottledWriter(append, sublime.set_timeout, self.settings.get("goguru_stream_interval", 100))
+
+        def done(result):
+            if result is None:
+                return
+            out, err, writer, records = result
+            streamed = writer is not None and writer is stream and writer.written
+            # queued after the last streamed batch, on the main thread
+            sublime.set_timeout(lambda: complete(out, err, streamed, records), 0)
+
+        def complete(out, err, streamed, records):
+            if "local_package" in prepared:
+                self.local_package = prepared["local_package"]
+            callback(out, err, streamed, records)
+
+        # pointer analysis only needs the main packages importing this one
+        auto_scope = self.settings.get("goguru_auto_scope", False) and mode in packages.POINTER_MODES
+        # the other modes ignore -scope, godoc needs the package for go doc
+        local = mode in packages.POINTER_MODES or self.mode in ("godoc", "godoc_direct")
+
+        def run_guru(job):
+            with trace.span(query_trace, "scope"):
+                scope = self.scope(prepared, settings, auto_scope, local)
+            run_cmd = with_scope(cmd, scope)
+            run_cache_parts = None
+            if cache_parts is not None:
+                # saved changes to the other files of the scope change the key
+                with trace.span(query_trace, "cache"):
+                    run_cache_parts = cache_parts + [scope, scope_state(file_path, cmd_env, settings)]
+            return self.runInThread(run_cmd, cmd_env, prepared["bundle"], file_path, settings, run_cache_parts, persist, job,
+                                    stream, guru_json, query_trace, (mode, scope, guru_tags), limits, pending_records.extend)
+
+        def work(job):
+            if query_trace is not None:
+                query_trace.add("queue", time.perf_counter() - submitted)
+            return run_guru(job)
+
+        # godoc parses guru's describe output, gopls hover text doesn't fit it
+        if self.settings.get("goguru_backend", "guru") == "gopls" and mode in lsp.MODES and \
+                self.mode not in ("godoc", "godoc_direct"):
+            if point is None:
+                point = self.view.sel()[0].end()
+            point = max(0, point - 1)
+            row, _ = self.view.rowcol(point)
+            character = lsp.utf16_len(self.view.substr(sublime.Region(self.view.text_point(row, 0), point)))
+            # every unsaved Go buffer is sent, like guru's -modified archive
+            documents = [(m.name, m.text, m.change_count) for m in modified]
+            if not any(m.name == file_path for m in modified):
+                documents.append((file_path, self.view.substr(sublime.Region(0, self.view.size())), self.view.change_count()))
+
+            def work(job):
+                if query_trace is not None:
+                    query_trace.add("queue", time.perf_counter() - submitted)
+                try:
+                    with trace.span(query_trace, "gopls"):
+                        client = get_lsp_client(file_path, cmd_env, settings)
+                        sync_lsp_documents(client, documents)
+                        return client.query(mode, file_path, row, character), '', None, None
+                except Exception:
+                    error("gopls:", sys.exc_info()[1])
+                    log("falling back to guru for", mode)
+                    return run_guru(job)
+
+        # identical queries on the same buffer state share a single run,
+        # a new query from the window supersedes the one still running there
+        # (godoc needs the local package resolved by its own run)
+        key = (tuple(cmd), tuple(prepared["scope"]), prepared["use_current_package"], auto_scope,
+               self.settings.get("goguru_backend", "guru"), self.view.buffer_id(), self.view.change_count(),
+               tuple((m.name, m.change_count) for m in modified), self.mode in ("godoc", "godoc_direct"))
+        if priority is None:
+            priority = scheduler.INTERACTIVE if mode in INTERACTIVE_MODES else scheduler.NORMAL
+        window = self.view.window()
+        submitted = time.perf_counter()
+        # a streamed output can't be handed to a later query, which would
+        # get it after its own header
+        get_scheduler(self.settings).submit(key, work, done, priority=priority,
+                                            group=window.id() if group is None else group, supersede=supersede,
+                                            shared=stream is None)
+        if group is None:
+            # a prefetch of this same query is joined above, the others give way
+            cancel_prefetch(window)
+
+    def runInThread(self, cmd, env, bundle, file_path, settings, cache_parts=None, persist=False, job=None, stream=None, json_output=False,
+                    query_trace=None, usage_key=None, limits=None, on_records=None):
+        """ Runs guru (on a scheduler worker) and returns its (out, err, writer,
+        records), None when the query got cancelled. The output is also written
+        to 'stream' as it arrives, in which case 'writer' is that stream.
+        'bundle' is the archive.Bundle of the unsaved buffers, 'settings'
+        the snapshot the query was made with.
+        With 'json_output' the output is decoded into records as it arrives
+        and 'out' is their condensed rendering. The phases are added to
+        'query_trace', guru's resource usage is logged under the (mode,
+        scope, tags) 'usage_key'. Guru runs within the process.Limits 'limits'.
+        'on_records(records)' gets the decoded records before they are streamed.
         """
+        with trace.span(query_trace, "archive"):
+            files = bundle.files()
+            digest = bundle.digest() if cache_parts is not None else None
+
+        key = None
+        if cache_parts is not None:
+            with trace.span(query_trace, "cache"):
+                key = make_key(digest, *cache_parts)
+                cached = get_result_cache(settings).get(key)
+            if cached is not None:
+                debug("cache hit", cache_parts)
+                if query_trace is not None:
+                    query_trace.info["cached"] = True
+                return cached[0], cached[1], None, cached[2]
+
+        # a superseded query must not append to the next one's output
+        if stream is not None and job is not None:
+            job.on_cancel(stream.discard)
+
+        decoder = None
+        records = None
+        if json_output:
+            decoder = JsonStreamDecoder()
+            records = []
+        # guru's own time is what query.run takes besides spawning and decoding
+        spent = {"spawn": 0, "decode": 0}
+        procs = []
+
+        def on_text(text):
+            if decoder is not None:
+                started = time.perf_counter()
+                decoded = decoder.feed(text)
+                records.extend(decoded)
+                text = render_records(decoded)
+                spent["decode"] += time.perf_counter() - started
+                if decoded and on_records is not None:
+                    on_records(decoded)
+            if text and stream is not None and not (job is not None and job.cancelled):
+                stream.write(text)
+
+        def on_spawn(proc):
+            procs.append(proc)
+            spent["spawn"] = proc.spawn_seconds
+            debug("spawned guru in %.1f ms" % (proc.spawn_seconds * 1000))
+
+        started = time.perf_counter()
+        result = query.run(cmd, env, files, job=job, on_text=on_text, keep=decoder is None, on_spawn=on_spawn, limits=limits)
+        elapsed = time.perf_counter() - started
+        if result is None:
+            debug("cancelled", cmd)
+            return None
+        out, err, returncode = result
+        if procs and procs[0].tripped is not None:
+            log("guru was stopped:", procs[0].tripped, cmd)
+            if query_trace is not None:
+                query_trace.info["tripped"] = procs[0].tripped
+        if usage_key is not None and procs and procs[0].usage is not None and settings.get("goguru_usage_log", True):
+            get_usage_log().write(usage.make_record(usage_key[0], usage_key[1], usage_key[2], procs[0].usage, elapsed, returncode))
+        if stream is not None:
+            stream.close()
+        if decoder is not None:
+            with trace.span(query_trace, "decode"):
+                decoder.close()
+                if decoder.error is not None:
+                    err += "couldn't decode guru's JSON output: %s\n" % decoder.error
+                out = render_records(records)
+        if query_trace is not None:
+            query_trace.add("spawn", spent["spawn"])
+            query_trace.add("guru", elapsed - spent["spawn"] - spent["decode"])
+            if decoder is not None:
+                query_trace.add("decode", spent["decode"])
+
+        # only successful answers are worth remembering
+        if key is not None and returncode == 0 and out:
+            get_result_cache(settings).put(key, out, err, persist=persist, records=records)
+        return out, err, stream, records
+
+
+class GoGuruFilterResultsCommand(sublime_plugin.WindowCommand):
+    """ Shows the results of the last json query matching a text.
+    """
 
-        pos = "#" + str(end_offset)
-        if begin_offset is not None:
-            pos = "#%i,#%i" % (begin_offset, end_offset)
+    def is_enabled(self):
+        return self.window.id() in last_records
 
+    def run(self):
+        def on_done(text):
+            records = last_records.get(self.window.id(), [])
+            text = text.lower()
+            matching = [r for r in records if text in r.location().lower() or text in r.desc.lower()]
+            show_report(self.window, 'filter "%s"' % text, render_records(matching), matching)
+        self.window.show_input_panel("GoGuru filter results:", "", on_done, None, None)
 
-        # golang config or shellenv ?
-        cmd_env = ''
-        if get_setting("goguru_use_golangconfig", False):
-            try:
-                toolpath, cmd_env = golangconfig.subprocess_info('guru', ['GOPATH', 'PATH'], view=self.view)
-                toolpath = os.path.realpath(toolpath)
-            except:
-                error("golangconfig:", sys.exc_info())
-                return
+
+class GoGuruLatencyStatsCommand(sublime_plugin.WindowCommand):
+    """ Shows the p50/p95/p99 latencies of the logged queries per mode and
+    per phase.
+    """
+
+    def run(self):
+        records = get_latency_log().read()
+        if records:
+            result = "%d queries\n\n%s" % (len(records), trace.format_stats(records))
         else:
-            toolpath = 'guru'
-            cmd_env = shellenv.get_env(for_subprocess=True)[1]
-            debug("cmd_env", cmd_env)
-            goguru_env = get_setting("goguru_env", {})
-            debug("goguru_env", goguru_env)
-            cmd_env.update(goguru_env)
+            result = "no queries logged yet, see goguru_latency_log\n"
+        show_report(self.window, "latency stats", result)
 
-        debug("final_env", cmd_env)
-        self.env = cmd_env
 
-        guru_scope = ",".join(get_setting("goguru_scope", ""))
+class GoGuruResourceUsageCommand(sublime_plugin.WindowCommand):
+    """ Shows the scope/mode combinations whose guru took the most memory
+    and CPU.
+    """
 
-        # add local package to guru scope
-        useCurrentPackage = get_setting("goguru_use_current_package", True)
-        debug("goguru_use_current_package", useCurrentPackage)
-        file_path = self.view.file_name()
+    def run(self):
+        records = get_usage_log().read()
+        if records:
+            result = "%d guru runs\n\n%s" % (len(records), usage.format_report(records))
+        else:
+            result = "no guru runs logged yet, see goguru_usage_log\n"
+        show_report(self.window, "resource usage", result)
 
-        if useCurrentPackage:
-            try:
-                GOPATH = os.path.realpath(cmd_env["GOPATH"])
-            except:
-                log("WARNING: using default GOPATH since it isn't declared ($HOME/go)")
-                GOPATH = os.path.expanduser("~/go")
-            debug("GOPATH", GOPATH)
-
-            local_package = get_local_package(GOPATH, file_path)
-            debug("local_package", local_package)
-            if sublime.platform() == 'windows':
-                local_package = local_package.replace('\\', '/')
-            self.local_package = local_package
-            guru_scope = guru_scope + ',' + local_package
-
-        guru_scope = guru_scope.strip()
-        debug("guru_scope", guru_scope)
-        if len(guru_scope) > 0:
-            guru_scope = "-scope " + guru_scope
-
-        guru_tags = "-tags \"" + " ".join(get_setting("goguru_tags", "")) + "\""
-
-        guru_json = ""
-        if get_setting("goguru_json", False):
-            guru_json = "-json"
-
-        # Build guru cmd.
-        # modified update 22/10/2019 - 3 (DD/MM/YYYY)
-        contents = self.view.substr(sublime.Region(0, self.view.size()))
-        cmd = "%(toolpath)s -modified %(scope)s %(tags)s %(guru_json)s %(mode)s %(file_path)s:%(pos)s" % {
-            "toolpath": toolpath,
-            "file_path": file_path,
-            "pos": pos,
-            "guru_json": guru_json,
-            "mode": mode,
-            "scope": guru_scope,
-            "tags": guru_tags
-        }
-        debug("cmd", cmd)
 
-        sublime.set_timeout_async(lambda: self.runInThread(cmd, callback, cmd_env, contents, file_path), 0)
+class GoGuruClearCacheCommand(sublime_plugin.ApplicationCommand):
 
-    def runInThread(self, cmd, callback, env, contents, file_path):
-        contentsbytes = contents.encode('utf-8',errors = 'strict')
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, env=env)
-        proc.stdin.write(bytes(file_path+'\n', encoding='utf8'))
-        proc.stdin.write(bytes(str(len(contentsbytes))+'\n', encoding='utf8'))
-        proc.stdin.write(contentsbytes)
-        out, err = proc.communicate()
-        callback(out.decode('utf-8'), err.decode('utf-8'))
+    def run(self):
+        get_result_cache(get_settings(sublime.active_window())).clear()
+        doc_cache.clear()
+        prefetch_store.clear()
+        package_graphs.clear()
+        if "shellenv" in globals():
+            shellenv.clear_cache()
+        log("result cache cleared")
 
 
 class GoGuruWriteResultsCommand(sublime_plugin.TextCommand):
     """ Writes the guru output to the current view.
     """
 
-    def run(self, edit, result, err):
+    def run(self, edit, result, err, streamed=False, records=None):
         view = self.view
 
-        view.insert(edit, view.size(), "\n")
-
-        if result:
-            view.insert(edit, view.size(), result)
+        if records:
+            location_table(view).expect(Record.from_list(r) for r in records)
+        pager = output_pagers.get(view.id())
+        if not streamed:
+            append_output(view, edit, "\n")
+            if result:
+                append_output(view, edit, pager.feed(result) if pager else result)
         if err:
             error(err)
-            view.insert(edit, view.size(), err)
+            append_output(view, edit, err)
 
-        view.insert(edit, view.size(), "\n\n\n")
+        if pager and pager.hidden():
+            append_output(view, edit, "\n... %d more lines, see 'GoGuru: Show More Results' and 'GoGuru: Show All Results'\n" % pager.hidden())
+        append_output(view, edit, "\n\n\n")
+
+
+class GoGuruAppendResultsCommand(sublime_plugin.TextCommand):
+    """ Appends a batch of guru output while it runs.
+    """
+
+    def run(self, edit, text, records=None):
+        if records:
+            location_table(self.view).expect(Record.from_list(r) for r in records)
+        pager = output_pagers.get(self.view.id())
+        if pager is not None:
+            text = pager.feed(text)
+        if text:
+            append_output(self.view, edit, text)
+
+
+class GoGuruWritePageCommand(sublime_plugin.TextCommand):
+    """ Writes lines held back by the pager of the output view.
+    """
+
+    def run(self, edit, lines=None):
+        pager = output_pagers.get(self.view.id())
+        if pager is None or not pager.hidden():
+            return
+        text = pager.take(lines)
+        append_output(self.view, edit, "\n")
+        append_output(self.view, edit, text if text.endswith("\n") else text + "\n")
+        if pager.hidden():
+            append_output(self.view, edit, "\n... %d more lines\n" % pager.hidden())
+        self.view.show(self.view.size())
+
+
+class GoGuruShowMoreResultsCommand(sublime_plugin.WindowCommand):
+    """ Renders the next page (or all) of the lines held back from the last result.
+    """
+
+    def is_enabled(self, all=False):
+        view = get_output_view_if_exists(self.window)
+        return view is not None and view.id() in output_pagers and output_pagers[view.id()].hidden() > 0
+
+    def run(self, all=False):
+        view = get_output_view_if_exists(self.window)
+        if view is None:
+            return
+        lines = None if all else get_settings(self.window).get("goguru_page_lines", 1000)
+        view.run_command('go_guru_write_page', {'lines': lines})
 
 
 class GoGuruWriteRunningCommand(sublime_plugin.TextCommand):
     """ Writes the guru output to the current view.
     """
 
-    def run(self, edit, mode):
+    def run(self, edit, mode, limit=0):
         view = self.view
+        output_pagers[view.id()] = OutputPager(limit)
+        location_table(view).forget()
 
         content = "Running guru " + mode + " command...\n"
         view.set_viewport_position(view.text_to_layout(view.size() - 1))
 
-        view.insert(edit, view.size(), content)
+        append_output(view, edit, content)
 
 
 class GoGuruShowResultsCommand(sublime_plugin.TextCommand):
 
     def run(self, edit):
-        if get_setting("goguru_output", "buffer") == "output_panel":
+        if get_settings(self.view.window()).get("goguru_output", "buffer") == "output_panel":
             self.view.window().run_command('show_panel', {'panel': "output.GoGuru Output"})
         else:
             output_view = get_output_view(self.view.window())
@@ -453,51 +992,540 @@ class GoGuruShowResultsCommand(sublime_plugin.TextCommand):
 class GoGuruOpenResultCommand(sublime_plugin.EventListener):
 
     def on_selection_modified(self, view):
-        if view.name() == "GoGuru Output":
-            if len(view.sel()) != 1:
+        # called for every view, anything but an output view leaves here
+        table = location_tables.get(view.id())
+        if table is None:
+            return
+
+        sel = view.sel()
+        if len(sel) != 1 or sel[0].empty():
+            return
+        row = view.rowcol(sel[0].begin())[0]
+        if view.rowcol(sel[0].end())[0] != row:
+            return
+
+        location = table.get(row)
+        if location is not None:
+            w = view.window()
+            new_view = w.open_file('%s:%d:%d' % location, sublime.ENCODED_POSITION)
+            group, index = w.get_view_index(new_view)
+            if group != -1:
+                w.focus_group(group)
+
+    def on_close(self, view):
+        location_tables.pop(view.id(), None)
+        output_pagers.pop(view.id(), None)
+
+
+class GoGuruGotoDefinitionCommand(GoGuruCommand):
+
+    def run(self, edit, mode=None, output=True):
+        super().run(edit=edit, mode="definition", output=False)
+
+
+class GoGuruCompositeCommand(GoGuruCommand):
+    """ Runs several modes (goguru_composite_modes by default) at the cursor
+    at once, each section of the report is written as soon as its guru
+    finishes.
+    """
+
+    def run(self, edit, modes=None):
+        self.output = True
+        self.prepared = None
+        self.snapshots = {}
+        self.trace = trace.Trace("composite")
+        with trace.span(self.trace, "settings"):
+            self.settings = get_settings(self.view.window())
+        modes = modes or self.settings.get("goguru_composite_modes", ["describe", "referrers", "implements"])
+        with trace.span(self.trace, "offsets"):
+            positions = self.cursor_positions()
+        if positions is None or not modes:
+            return
+        _, byte_end, byte_begin = positions[0]
+
+        self.write_running(", ".join(modes))
+        if not self.prepare(self.guru_complete):
+            return
+        window = self.view.window()
+        output_view = get_output_view(window, self.settings)
+        pending = set(modes)
+        records = []
+
+        def section(mode, out, err, streamed=False, found=None):
+            pending.discard(mode)
+            text = "\n%s:\n%s" % (mode, out or "no results\n")
+            if err:
+                error(err)
+                text += err
+            with trace.span(self.trace, "render"):
+                output_view.run_command('go_guru_append_results', {'text': text, 'records': record_lists(found)})
+            records.extend(found or [])
+            if not pending:
+                if records:
+                    last_records[window.id()] = records
+                output_view.run_command('go_guru_write_results', {'result': '', 'err': '', 'streamed': True})
+                finish_trace(self.view, self.trace, self.settings)
+
+        for i, mode in enumerate(modes):
+            self.guru(byte_end, begin_offset=byte_begin, mode=mode, callback=lambda *a, mode=mode: section(mode, *a),
+                      streaming=False, supersede=i == 0)
+
+
+class GoGuruPrefetchListener(sublime_plugin.EventListener):
+    """ Prefetches the modes set in goguru_prefetch once the cursor rests on
+    an identifier for goguru_prefetch_delay ms, edits cancel them.
+    """
+
+    def on_selection_modified(self, view):
+        window = view.window()
+        if window is None:
+            return
+        settings = get_settings(window)
+        if not settings.get("goguru_prefetch", []):
+            return
+        sel = view.sel()
+        if len(sel) != 1 or not sel[0].empty() or not view.match_selector(sel[0].b, "source.go"):
+            return
+        token = (view.change_count(), sel[0].b)
+        prefetch_pending[view.id()] = token
+        sublime.set_timeout(lambda: self.on_rest(view, token), settings.get("goguru_prefetch_delay", 500))
+
+    def on_rest(self, view, token):
+        if prefetch_pending.get(view.id()) != token or view.window() is None:
+            return
+        del prefetch_pending[view.id()]
+        sel = view.sel()
+        if len(sel) != 1 or (view.change_count(), sel[0].b) != token:
+            return
+        GoGuruCommand(view).prefetch(get_settings(view.window()).get("goguru_prefetch", []))
+
+    def on_modified(self, view):
+        prefetch_pending.pop(view.id(), None)
+        prefetch_store.discard_buffer(view.buffer_id())
+        if view.window() is not None:
+            cancel_prefetch(view.window())
+
+    def on_close(self, view):
+        prefetch_pending.pop(view.id(), None)
+        prefetch_store.discard_buffer(view.buffer_id())
+
+
+class GoGuruSettingsListener(sublime_plugin.EventListener):
+    """ Project settings aren't covered by add_on_change.
+    """
+
+    def on_load_project(self, window):
+        invalidate_settings()
+
+    def on_post_save_project(self, window):
+        invalidate_settings()
+
+    def on_post_save(self, view):
+        file_name = view.file_name()
+        if file_name and file_name.endswith(".sublime-project"):
+            invalidate_settings()
+
+
+class GoGuruCacheListener(sublime_plugin.EventListener):
+    """ A saved Go file may change the results of any query of its scope.
+    """
+
+    def on_post_save(self, view):
+        file_name = view.file_name()
+        if file_name and file_name.endswith(".go") and result_cache is not None:
+            sublime.set_timeout_async(result_cache.clear, 0)
+
+
+class GoGuruLineIndexListener(sublime_plugin.EventListener):
+
+    def on_close(self, view):
+        line_indexes.pop(view.buffer_id(), None)
+        file_name = view.file_name()
+        if file_name and lsp_clients:
+            sublime.set_timeout_async(lambda: close_lsp_document(file_name), 0)
+
+
+if hasattr(sublime_plugin, 'TextChangeListener'):
+    class GoGuruLineIndexChangeListener(sublime_plugin.TextChangeListener):
+        """ Keeps the line index of the buffer up to date while it is edited,
+        without this (Sublime Text 3) the index is rebuilt on the next query.
+        """
+
+        def on_text_changed(self, changes):
+            index = line_indexes.get(self.buffer.id())
+            if index is None:
                 return
-            if view.sel()[0].size() == 0:
+            change_count = self.buffer.primary_view().change_count()
+            # rebuilt by a query after these edits, they are in it already
+            if index.change_count == change_count:
                 return
+            for c in changes:
+                index.replace(c.a.row, c.a.col, c.a.col_utf8, c.b.row, c.b.col, c.b.col_utf8, c.str)
+            index.change_count = change_count
 
-            lines = view.lines(view.sel()[0])
-            if len(lines) != 1:
-                return
 
-            line = view.full_line(lines[0])
-            text = view.substr(line)
+# line indexes by buffer id, see get_line_index
+line_indexes = {}
 
-            # format = get_setting("guru_format")
 
-            # "filename:line:col" pattern for json
-            m = re.search("\"([^\"]+):([0-9]+):([0-9]+)\"", text)
+def take_snapshot(view, snapshots=None):
+    """ Returns the archive.Snapshot of the view's buffer, reusing the one
+    in 'snapshots' (buffer id -> Snapshot, shared by the steps of a query)
+    while it is current.
+    """
+    crlf = view.line_endings() == "Windows"
+    snapshot = snapshots.get(view.buffer_id()) if snapshots is not None else None
+    if snapshot is None or snapshot.change_count != view.change_count() or snapshot.crlf != crlf:
+        snapshot = archive.Snapshot(view.file_name(), view.substr(sublime.Region(0, view.size())), crlf, view.change_count())
+        if snapshots is not None:
+            snapshots[view.buffer_id()] = snapshot
+    return snapshot
+
+
+def get_line_index(view, snapshots=None):
+    """ Returns the line index of the view's buffer, (re)building it from
+    its snapshot (see take_snapshot) when it isn't in sync with the buffer.
+    """
+    crlf = view.line_endings() == "Windows"
+    index = line_indexes.get(view.buffer_id())
+    if index is None or index.crlf != crlf or index.change_count != view.change_count():
+        debug("building line index", view.buffer_id())
+        snapshot = take_snapshot(view, snapshots)
+        index = LineIndex(snapshot.text, crlf, snapshot.data)
+        index.change_count = view.change_count()
+        line_indexes[view.buffer_id()] = index
+    return index
+
+
+def byte_offset(view, point, snapshots=None):
+    """ Converts the character offset 'point' of the view into the byte offset
+    guru expects (utf-8, line endings as they are written on disk).
+    """
+    return get_line_index(view, snapshots).byte_offset(point, lambda a, b: view.substr(sublime.Region(a, b)))
 
-            # >filename:line:col< pattern for xml
-            if m is None:
-                m = re.search(">([^<]+):([0-9]+):([0-9]+)<", text)
 
-            # filename:line.col-line.col: pattern for plain
-            if m is None:
-                m = re.search("^(.+\.go):([0-9]+).([0-9]+)[-: ]", text)
+def get_modified_files(window, snapshots=None):
+    """ Returns the archive.Snapshot of every unsaved Go buffer of the window,
+    the files guru must not read from disk.
+    """
+    files = []
+    seen = set()
+    for v in window.views():
+        file_name = v.file_name()
+        if not v.is_dirty() or not file_name or not file_name.endswith(".go") or v.buffer_id() in seen:
+            continue
+        seen.add(v.buffer_id())
+        files.append(take_snapshot(v, snapshots))
+    return files
 
-            if m:
-                w = view.window()
-                new_view = w.open_file(m.group(1) + ':' + m.group(2) + ':' + m.group(3), sublime.ENCODED_POSITION)
-                group, index = w.get_view_index(new_view)
-                if group != -1:
-                    w.focus_group(group)
 
+query_scheduler = None
 
-class GoGuruGotoDefinitionCommand(GoGuruCommand):
 
-    def run(self, edit, mode=None, output=True):
-        super().run(edit=edit, mode="definition", output=False)
+def get_scheduler(settings):
+    """ Returns the scheduler running the queries, creating it on first use.
+    """
+    global query_scheduler
+    if query_scheduler is None:
+        query_scheduler = scheduler.Scheduler(workers=settings.get("goguru_max_processes", 2))
+    return query_scheduler
+
+
+doc_cache = godoc.DocCache()
+
+# prefetched results, and the cursor position waiting to be prefetched by view id
+prefetch_store = PrefetchStore()
+prefetch_pending = {}
+
+
+def prefetch_key(view, point):
+    """ Returns the prefetch store key of the identifier before 'point'
+    (where queries are run), None when there is no identifier there.
+    """
+    if point == 0 or not view.file_name():
+        return None
+    word = view.word(point - 1)
+    if not word.contains(point - 1) or view.match_selector(point - 1, "comment, string"):
+        return None
+    text = view.substr(word)
+    if not (text[:1].isalpha() or text[:1] == "_") or not all(c.isalnum() or c == "_" for c in text):
+        return None
+    return (view.buffer_id(), view.change_count(), word.begin())
+
+
+def prefetch_group(window, mode):
+    return ("prefetch", window.id(), mode)
+
+
+def cancel_prefetch(window):
+    if query_scheduler is None:
+        return
+    for mode in PREFETCH_MODES:
+        query_scheduler.cancel_group(prefetch_group(window, mode))
+
+# decoded records of the last json query by window id
+last_records = {}
+
+
+result_cache = None
+
+
+def get_result_cache(settings):
+    """ Returns the guru result cache, creating it on first use.
+    """
+    global result_cache
+    if result_cache is None:
+        directory = None
+        if settings.get("goguru_cache_disk", False):
+            directory = os.path.join(sublime.cache_path(), "GoGuru", "results")
+        result_cache = ResultCache(
+            max_bytes=settings.get("goguru_cache_size", 32) * 1024 * 1024,
+            directory=directory,
+            disk_ttl=settings.get("goguru_cache_disk_ttl", 7 * 24 * 3600))
+    return result_cache
+
+
+latency_log = None
+
+
+def get_latency_log():
+    """ Returns the log of the query traces, creating it on first use.
+    """
+    global latency_log
+    if latency_log is None:
+        latency_log = trace.TraceLog(os.path.join(sublime.cache_path(), "GoGuru", "latency.jsonl"))
+    return latency_log
 
 
-def get_output_view(window):
+usage_log = None
+
+
+def get_usage_log():
+    """ Returns the resource usage history of guru, creating it on first use.
+    """
+    global usage_log
+    if usage_log is None:
+        usage_log = trace.TraceLog(os.path.join(sublime.cache_path(), "GoGuru", "usage.jsonl"))
+    return usage_log
+
+
+def finish_trace(view, query_trace, settings):
+    """ Stops 'query_trace', shows its breakdown in the status bar and
+    logs it (off the main thread).
+    """
+    if query_trace is None or not query_trace.finish():
+        return
+    summary = query_trace.summary()
+    debug(summary)
+    if settings.get("goguru_latency_status", True):
+        view.set_status("goguru_latency", summary)
+    if settings.get("goguru_latency_log", True):
+        record = query_trace.to_dict()
+        sublime.set_timeout_async(lambda: get_latency_log().write(record), 0)
+
+
+# gopls sessions by (module root, command line)
+lsp_clients = {}
+lsp_clients_lock = threading.Lock()
+# (module root, command line) -> lock held while starting that session
+lsp_start_locks = {}
+
+
+def get_lsp_client(file_path, env, settings):
+    """ Returns a running gopls session for the module containing file_path,
+    starting one if needed.
+    """
+    argv = settings.get("goguru_gopls_cmd", ["gopls"])
+    root = packages.module_root(os.path.dirname(file_path))
+    key = (root, tuple(argv))
+    with lsp_clients_lock:
+        client = lsp_clients.get(key)
+        if client is not None and client.alive():
+            return client
+        start_lock = lsp_start_locks.setdefault(key, threading.Lock())
+
+    # the handshake can take a while, only the queries of this session wait for it
+    with start_lock:
+        with lsp_clients_lock:
+            client = lsp_clients.get(key)
+        if client is not None and client.alive():
+            return client
+        debug("starting gopls", argv, root)
+        client = lsp.LspClient(argv, root, env=env, timeout=settings.get("goguru_gopls_timeout", 30))
+        client.start()
+        with lsp_clients_lock:
+            lsp_clients[key] = client
+    return client
+
+
+def sync_lsp_documents(client, documents):
+    """ Sends the (path, text, version) 'documents' to the gopls session,
+    the documents it got before and that aren't among them any more (saved
+    or reverted) are closed so they are read from disk again.
+    """
+    paths = set(d[0] for d in documents)
+    for path in client.synced():
+        if path not in paths:
+            client.close_document(path)
+    for path, text, version in documents:
+        client.sync(path, text, version)
+
+
+def close_lsp_document(file_name):
+    for client in list(lsp_clients.values()):
+        if client.alive():
+            client.close_document(file_name)
+
+
+package_graphs = packages.GraphCache()
+
+
+def get_package_graph(root, env, settings):
+    """ Returns the package graph of the module at root, see packages.GraphCache.
+    """
+    go = process.resolve("go", env) or "go"
+    graph = package_graphs.get(go, env, root, settings.get("goguru_tags", []))
+    if graph.error is not None:
+        debug("go list:", graph.error)
+    return graph
+
+
+def find_package(file_path, env, settings):
+    """ Returns the package graph of the module of file_path and the import
+    path of the file's package, which is None when the graph doesn't know it.
+    """
+    directory = os.path.dirname(file_path)
+    root = packages.module_root(directory)
+    if not packages.is_module(root):
+        return None, None
+    graph = get_package_graph(root, env, settings)
+    package = graph.package_for_dir(directory)
+    if package is None:
+        package = graph.package_for_dir(os.path.realpath(directory))
+    return graph, package
+
+
+def resolve_package(file_path, env, settings):
+    """ Returns the import path of the package of file_path, looked up in the
+    module's package graph or derived from the GOPATH ('' when neither knows).
+    """
+    _, package = find_package(file_path, env, settings)
+    if package is not None:
+        return package
+    GOPATH = env.get("GOPATH")
+    if not GOPATH:
+        debug("using default GOPATH since it isn't declared ($HOME/go)")
+        GOPATH = os.path.expanduser("~/go")
+    return packages.gopath_package(GOPATH, os.path.dirname(file_path))
+
+
+def scope_state(file_path, env, settings):
+    """ Identifies the state of the files guru reads for a query on file_path:
+    the mtimes of the package directories and .go files of its module (see
+    packages.GraphCache), of the file's own package outside of a module.
+    """
+    directory = os.path.dirname(file_path)
+    root = packages.module_root(directory)
+    if packages.is_module(root):
+        return get_package_graph(root, env, settings).state
+    return packages.dir_state(directory)
+
+
+def get_auto_scope(file_path, env, settings):
+    """ Returns the main packages (transitively) importing the package of
+    file_path, None when the package graph can't tell.
+    """
+    graph, package = find_package(file_path, env, settings)
+    if package is None:
+        return None
+    return graph.scope_for(package)
+
+
+def with_scope(cmd, scope):
+    """ Returns a copy of the guru command line using 'scope' (comma separated packages).
+    """
+    if not scope:
+        return cmd
+    cmd = list(cmd)
+    if "-scope" in cmd:
+        cmd[cmd.index("-scope") + 1] = scope
+    else:
+        cmd[1:1] = ["-scope", scope]
+    return cmd
+
+
+# target location of the lines of the output views by view id
+location_tables = {}
+
+# pagers of the last result of the output views by view id
+output_pagers = {}
+
+
+def location_table(view):
+    table = location_tables.get(view.id())
+    if table is None:
+        table = location_tables[view.id()] = LocationTable()
+    return table
+
+
+def record_lists(records):
+    """ 'records' as command arguments, see Record.from_list.
+    """
+    if not records:
+        return None
+    return [r.to_list() for r in records]
+
+
+def append_output(view, edit, text):
+    """ Appends 'text' to an output view, recording where its lines point to.
+    """
+    point = view.size()
+    row, col = view.rowcol(point)
+    prefix = view.substr(sublime.Region(view.text_point(row, 0), point)) if col else ''
+    view.insert(edit, point, text)
+    location_table(view).add(row, prefix + text)
+
+
+def show_output(window, view, settings, panel=True):
+    """ Brings the output view forward: opens the output panel, when it is
+    one and 'panel' allows it, else focuses the view.
+    """
+    if settings.get("goguru_output", "buffer") == "output_panel" and panel:
+        window.run_command('show_panel', {'panel': "output." + view.name()})
+    else:
+        window.focus_view(view)
+
+
+def show_report(window, title, text, records=None):
+    """ Writes 'text' to the output view of 'window' as the result of
+    'title' and shows it, 'records' are the ones rendered in 'text'.
+    """
+    settings = get_settings(window)
+    view = get_output_view(window, settings)
+    view.run_command('go_guru_write_running', {'mode': title})
+    view.run_command('go_guru_write_results', {'result': text, 'err': '', 'records': record_lists(records)})
+    show_output(window, view, settings)
+
+
+def get_output_view_if_exists(window):
+    """ Returns the output view of the window without creating it, or None.
+    """
+    view = window.find_output_panel('GoGuru Output')
+    if view is not None:
+        return view
+    for v in window.views():
+        if v.name() == 'GoGuru Output':
+            return v
+    return None
+
+
+def get_output_view(window, settings=None):
     view = None
     buff_name = 'GoGuru Output'
 
-    if get_setting("goguru_output", "buffer") == "output_panel":
+    if settings is None:
+        settings = get_settings(window)
+    if settings.get("goguru_output", "buffer") == "output_panel":
         view = window.create_output_panel(buff_name)
     else:
         # If the output file is already open, use that.
@@ -519,33 +1547,56 @@ def get_output_view(window):
     return view
 
 
-def get_setting(key, default=None):
-    """ Returns the setting in the following hierarchy: project setting, user setting,
-    default setting.  If none are set the 'default' value passed in is returned.
+debug_enabled = False
+
+# settings snapshots by window id, see get_settings
+settings_snapshots = {}
+
+
+def invalidate_settings():
+    settings_snapshots.clear()
+
+
+def get_settings(window):
+    """ Returns the settings snapshot of the window, merging in the following
+    hierarchy: project setting, user setting, default setting.
+    The snapshot is only rebuilt after the settings changed.
     """
-    project_settings = sublime.active_window().active_view().settings().get('GoGuru', {})
-    if key in project_settings:
-        return project_settings.get(key)
+    global debug_enabled
+    window_id = window.id() if window is not None else None
+    snapshot = settings_snapshots.get(window_id)
+    if snapshot is not None:
+        return snapshot
 
+    defaults = load_default_settings()
     user_settings = sublime.load_settings("GoGuru.sublime-settings")
-    if user_settings.has(key):
-        return user_settings.get(key)
+    user = dict((key, user_settings.get(key)) for key in defaults if user_settings.has(key))
+    project = {}
+    if window is not None:
+        project = (window.project_data() or {}).get("settings", {}).get("GoGuru", {})
 
-    return sublime.load_settings("Default.sublime-settings").get(key, default)
+    snapshot = Settings(project, user, defaults)
+    settings_snapshots[window_id] = snapshot
+    debug_enabled = snapshot.get("goguru_debug", False)
+    return snapshot
 
 
-def get_local_package(GOPATH, file_path):
+def load_default_settings():
+    """ Returns the package default settings as a dict.
     """
-    Returns the local package name based on file_path.
-    Rational: the GOPATH is usually composed of multiple paths separated
-    by ":". The idea is to check the first one that matches the file_path
-    to get the package name.
+    try:
+        return sublime.decode_value(sublime.load_resource("Packages/%s/Default.sublime-settings" % __package__))
+    except Exception:
+        # not installed under Packages, read it next to this file
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Default.sublime-settings")) as f:
+            return sublime.decode_value(f.read())
+
+
+def get_setting(key, default=None):
+    """ Returns the setting of the active window, see get_settings.
+    If none are set the 'default' value passed in is returned.
     """
-    current_file_path = os.path.realpath(os.path.dirname(file_path))
-    for path in GOPATH.split(":"):
-        guessing_path = os.path.join(path, "src")
-        if file_path.startswith(guessing_path):
-            return os.path.relpath(current_file_path, guessing_path)
+    return get_settings(sublime.active_window()).get(key, default)
+
 
-    # the GOPATH and the file in question are not aligned
-    return ""
+import_seconds = time.perf_counter() - import_started